@@ -3,7 +3,7 @@ app.py - Smart Visitor Management System — AI Service
 
 FastAPI application that wires together:
   - Enrollment  (POST /enroll)
-  - Recognition (POST /recognize)
+  - Recognition (POST /recognize, /recognize/form)
   - Camera management (POST /cameras/register, /cameras/{id}/start, etc.)
   - Alerts (GET /alerts)
   - Visitors (GET /visitors)
@@ -14,33 +14,42 @@ from __future__ import annotations
 
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone
+from functools import partial
 from io import BytesIO
-from typing import Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import cv2
 import numpy as np
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+import orjson
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from batch_scheduler import BatchScheduler
 from behavior_analyzer import BehaviorAnalyzer
 from camera_manager import CameraConfig, CameraManager
 from db import ensure_indexes
 from enrollment_manager import EnrollmentManager
 from event_dispatcher import EventDispatcher
 from geofence_monitor import GeofenceMonitor
-from recognition_engine import RecognitionEngine
+from recognition_engine import FaceMatch, RecognitionEngine, frame_dhash, preprocess
 from tracker import MultiCameraTracker
 
 # ──────────────────────────────────────────────────────────
 # Logging
 # ──────────────────────────────────────────────────────────
 
+# ENV=prod switches to quieter logging and the uvloop/httptools server stack
+PRODUCTION = os.getenv("ENV", "dev") == "prod"
+
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv("LOG_LEVEL", "WARNING" if PRODUCTION else "INFO").upper(),
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
 )
 logger = logging.getLogger("smart_vms")
@@ -49,13 +58,28 @@ logger = logging.getLogger("smart_vms")
 # Component initialisation
 # ──────────────────────────────────────────────────────────
 
-recognition_engine = RecognitionEngine()
-enrollment_manager = EnrollmentManager()
-tracker = MultiCameraTracker()
+# Longest side frames are downscaled to before detection (0 = full size)
+FRAME_MAX_SIDE = int(os.getenv("FRAME_MAX_SIDE", 640))
+
+recognition_engine = RecognitionEngine(
+    quantize=os.getenv("GALLERY_INT8", "0") == "1",
+    onnx_model_path=os.getenv("EMBEDDER_ONNX", ""),
+    force_cpu=os.getenv("FORCE_CPU", "0") == "1",
+    max_side=FRAME_MAX_SIDE,
+)
+# Enroll through the engine's embedder so gallery and probes share a space
+enrollment_manager = EnrollmentManager(
+    embedder=recognition_engine.embed_face,
+    embedding_model=recognition_engine.embedding_model,
+)
+tracker = MultiCameraTracker(
+    flush_interval_ms=float(os.getenv("TRACKER_FLUSH_MS", 200)),
+)
 behavior_analyzer = BehaviorAnalyzer(
     loitering_threshold_seconds=int(os.getenv("LOITERING_SECONDS", 60)),
     duplicate_suppression_seconds=int(os.getenv("DUP_SUPPRESS_SECONDS", 30)),
     unknown_alert_interval_seconds=int(os.getenv("UNKNOWN_ALERT_SECONDS", 45)),
+    inside_ttl_seconds=int(os.getenv("INSIDE_TTL_SECONDS", 8 * 3600)),
 )
 geofence_monitor = GeofenceMonitor(
     violation_threshold_seconds=int(os.getenv("GEOFENCE_VIOLATION_SECONDS", 60)),
@@ -65,6 +89,27 @@ dispatcher = EventDispatcher(
     backend_url=os.getenv("BACKEND_WEBHOOK_URL", ""),
 )
 
+# Dedicated inference thread: keeps model work off the default executor
+# that FastAPI uses for file I/O, so HTTP endpoints never queue behind it.
+infer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="infer")
+batch_scheduler = BatchScheduler(
+    recognition_engine.identify_batch,
+    max_batch_size=int(os.getenv("BATCH_MAX", 8)),
+    max_wait_ms=float(os.getenv("BATCH_TIMEOUT_MS", 15)),
+    max_queue_size=int(os.getenv("INFER_QUEUE_SIZE", 16)),
+    executor=infer_executor,
+)
+
+
+# Static-scene gating: a camera frame whose dHash differs from the last
+# recognised one by at most STATIC_FRAME_BITS bits reuses its matches, for
+# up to STATIC_FRAME_MAX_AGE seconds (0 disables the gate).
+STATIC_FRAME_BITS = int(os.getenv("STATIC_FRAME_BITS", 2))
+STATIC_FRAME_MAX_AGE = float(os.getenv("STATIC_FRAME_MAX_AGE", 1.0))
+
+# camera_id → (dhash, monotonic time, matches) of the last recognised frame
+_last_recognised: Dict[str, Tuple[int, float, List[FaceMatch]]] = {}
+
 
 # ──────────────────────────────────────────────────────────
 # Frame processing pipeline (called by CameraWorker)
@@ -76,22 +121,31 @@ async def on_frame(
     zone_type: str,
     timestamp: datetime,
     frame: np.ndarray,
+    scale: float = 1.0,
 ) -> None:
     """
     Process one video frame end-to-end:
       detect → identify → track → analyse → geofence check → dispatch
+
+    `frame` may be downscaled by the capture thread; `scale` maps its
+    coordinates back to the source resolution the geofences are drawn on.
     """
-    matches = await _run_recognition(frame)
+    matches = await _recognise_camera_frame(camera_id, frame)
+    if matches is None:
+        # Frame was shed by the scheduler under load
+        return
 
+    alerts: List[dict] = []
+    positions: List[dict] = []
     for match in matches:
-        # Calculate face centroid for geofencing
+        # Calculate face centroid for geofencing (source-frame pixels)
         bbox = match.bounding_box
         centroid = (
-            bbox['x'] + bbox['w'] // 2,
-            bbox['y'] + bbox['h'] // 2,
+            int((bbox['x'] + bbox['w'] // 2) / scale),
+            int((bbox['y'] + bbox['h'] // 2) / scale),
         )
 
-        # 1. Persist tracking event
+        # 1. Buffer tracking event (flushed to Mongo in the background)
         tracker.record(
             visitor_id=match.visitor_id,
             name=match.name,
@@ -103,7 +157,7 @@ async def on_frame(
         )
 
         # 2. Behaviour analysis → alerts (restricted zone, unknown, re-entry)
-        alerts = behavior_analyzer.analyze(
+        alerts += behavior_analyzer.analyze(
             visitor_id=match.visitor_id,
             name=match.name,
             camera_id=camera_id,
@@ -114,35 +168,64 @@ async def on_frame(
             timestamp=timestamp,
         )
 
-        # 3. Geofence monitoring → loitering alerts
-        geofence_alert = geofence_monitor.check_position(
-            visitor_id=match.visitor_id,
-            name=match.name,
-            camera_id=camera_id,
-            position=centroid,
-            location=location,
-            confidence=match.confidence,
-            timestamp=timestamp,
-        )
-        if geofence_alert:
-            alerts.append(geofence_alert)
+        positions.append({
+            "visitor_id": match.visitor_id,
+            "name": match.name,
+            "camera_id": camera_id,
+            "position": centroid,
+            "location": location,
+            "confidence": match.confidence,
+            "timestamp": timestamp,
+        })
 
-        # 4. Dispatch all alerts to backend (fire-and-forget)
-        for alert in alerts:
-            await dispatcher.dispatch(alert)
+    # 3. Geofence monitoring → loitering alerts (all faces in one test)
+    alerts += filter(None, geofence_monitor.check_positions_bulk(positions))
+
+    # 4. Queue all alerts for batched delivery to backend (fire-and-forget)
+    for alert in alerts:
+        await dispatcher.dispatch(alert)
 
 
 async def _run_recognition(frame: np.ndarray):
-    """Run recognition in a thread to avoid blocking the event loop."""
-    import asyncio
-    return await asyncio.to_thread(recognition_engine.identify, frame)
+    """Queue the frame for batched recognition across all cameras."""
+    return await batch_scheduler.submit(frame)
+
+
+async def _recognise_camera_frame(camera_id: str, frame: np.ndarray):
+    """
+    Recognise a camera frame, or reuse the camera's last matches when the
+    scene has not changed since then (see STATIC_FRAME_BITS).
+
+    Downstream tracking still runs on every frame, so dwell timers keep
+    advancing for people standing still in an unchanged scene.
+    """
+    if STATIC_FRAME_MAX_AGE <= 0:
+        return await _run_recognition(frame)
+
+    frame_hash = frame_dhash(frame)
+    now = time.monotonic()
+    last = _last_recognised.get(camera_id)
+    if (
+        last is not None
+        and now - last[1] < STATIC_FRAME_MAX_AGE
+        and (frame_hash ^ last[0]).bit_count() <= STATIC_FRAME_BITS
+    ):
+        return last[2]
+
+    matches = await _run_recognition(frame)
+    if matches is not None:
+        _last_recognised[camera_id] = (frame_hash, now, matches)
+    return matches
 
 
 # ──────────────────────────────────────────────────────────
 # Camera manager (needs on_frame callback)
 # ──────────────────────────────────────────────────────────
 
-camera_manager = CameraManager(on_frame=on_frame)
+camera_manager = CameraManager(
+    on_frame=on_frame,
+    preprocess=partial(preprocess, max_side=FRAME_MAX_SIDE),
+)
 
 
 # ──────────────────────────────────────────────────────────
@@ -153,7 +236,15 @@ camera_manager = CameraManager(on_frame=on_frame)
 async def lifespan(app: FastAPI):
     logger.info("🚀 Smart VMS AI Service starting...")
     ensure_indexes()
+    recognition_engine.warmup()
     recognition_engine.load_embeddings()
+    enrollment_manager.refresh_count()
+    behavior_analyzer.refresh_alert_count()
+    batch_scheduler.start()
+    tracker.start()
+    behavior_analyzer.start()
+    geofence_monitor.start()
+    dispatcher.start()
     camera_manager.load_from_db()
     
     # Load geofence boundaries from files
@@ -168,6 +259,11 @@ async def lifespan(app: FastAPI):
     yield
     logger.info("🛑 Shutting down cameras...")
     await camera_manager.stop_all()
+    await batch_scheduler.stop()
+    infer_executor.shutdown(wait=False)
+    await tracker.stop()
+    await behavior_analyzer.stop()
+    await geofence_monitor.stop()
     await dispatcher.close()
     logger.info("👋 Shutdown complete.")
 
@@ -176,23 +272,122 @@ async def lifespan(app: FastAPI):
 # FastAPI app
 # ──────────────────────────────────────────────────────────
 
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered by orjson (handles datetime / numpy natively)."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(
+            content,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC,
+        )
+
+
 app = FastAPI(
     title="Smart Visitor Management AI Service",
     version="2.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url=None,  # Disable Swagger UI
     redoc_url=None,  # Disable ReDoc
 )
 
+# Comma-separated list of allowed origins. Unset falls back to "*" in
+# development only; in production it allows no cross-origin requests.
+CORS_ORIGINS = [
+    o.strip()
+    for o in os.getenv("CORS_ORIGINS", "" if PRODUCTION else "*").split(",")
+    if o.strip()
+]
+if PRODUCTION and not CORS_ORIGINS:
+    logger.warning("CORS_ORIGINS is not set; cross-origin requests are refused.")
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
+    allow_origins=CORS_ORIGINS,
+    # Never combine credentials with the wildcard: Starlette would echo
+    # any Origin back as allowed
+    allow_credentials="*" not in CORS_ORIGINS,
+    allow_methods=["GET", "POST", "DELETE"],
     allow_headers=["*"],
+    max_age=600,    # let browsers cache preflight responses for 10 min
 )
 
 
+# Image uploads are raw bodies (/recognize) or multipart forms (/enroll,
+# /recognize/form); neither accepts base64 JSON. Bodies over the limit get a
+# 413: from the Content-Length header before anything is read, or, for
+# chunked bodies without one, as soon as the bytes received pass the limit,
+# so no upload is buffered or spooled beyond MAX_UPLOAD_BYTES.
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", 10)) * 1024 * 1024)
+_UPLOAD_PATHS = ("/enroll", "/recognize", "/recognize/form")
+
+
+class _UploadTooLarge(Exception):
+    """Raised from `receive` once a request body passes the upload limit."""
+
+
+class UploadSizeLimit:
+    """ASGI middleware enforcing MAX_UPLOAD_BYTES on the upload endpoints."""
+
+    def __init__(self, app: ASGIApp, max_bytes: int, paths: Tuple[str, ...]) -> None:
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise _UploadTooLarge()
+            return message
+
+        async def guarded_send(message: Message) -> None:
+            nonlocal started
+            if exceeded:
+                # Replaced by the 413 below (e.g. FastAPI turns the error into a 400)
+                return
+            started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _UploadTooLarge:
+            pass
+        if exceeded and not started:
+            await self._reject(scope, receive, send)
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send) -> None:
+        response = ORJSONResponse(
+            status_code=413,
+            content={"detail": f"Upload exceeds {self.max_bytes // (1024 * 1024)} MB limit."},
+        )
+        await response(scope, receive, send)
+
+
+app.add_middleware(UploadSizeLimit, max_bytes=MAX_UPLOAD_BYTES, paths=_UPLOAD_PATHS)
+
+
 # ──────────────────────────────────────────────────────────
 # Pydantic request models
 # ──────────────────────────────────────────────────────────
@@ -210,9 +405,66 @@ class CameraRegisterRequest(BaseModel):
 # Helpers
 # ──────────────────────────────────────────────────────────
 
-def _decode_image(contents: bytes) -> np.ndarray:
+# Decode-time downscale factor → OpenCV flag (JPEGs are scaled inside libjpeg)
+_IMREAD_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Enrollment photos are often 4–12 MP phone shots; the embedder needs far less.
+# Large photos are decoded at 1/2 or 1/4 size, keeping at least this long side.
+ENROLL_DECODE_MIN_SIDE = 1000
+
+# JPEG start-of-frame markers (SOF0–SOF15 minus DHT, JPG and DAC)
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _image_size(contents: bytes) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from a PNG or JPEG header without decoding it."""
+    if contents[:8] == b"\x89PNG\r\n\x1a\n" and len(contents) >= 24:
+        return int.from_bytes(contents[16:20], "big"), int.from_bytes(contents[20:24], "big")
+    if contents[:2] != b"\xff\xd8":
+        return None
+
+    pos = 2
+    while pos + 4 <= len(contents):
+        if contents[pos] != 0xFF:
+            return None
+        marker = contents[pos + 1]
+        if marker == 0xFF:                      # fill byte
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            pos += 2                            # standalone marker, no length
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            if pos + 9 > len(contents):
+                return None
+            height = int.from_bytes(contents[pos + 5:pos + 7], "big")
+            width = int.from_bytes(contents[pos + 7:pos + 9], "big")
+            return width, height
+        pos += 2 + int.from_bytes(contents[pos + 2:pos + 4], "big")
+    return None
+
+
+def _enroll_reduction(contents: bytes) -> int:
+    """Pick the decode reduction for an enrollment photo from its header size."""
+    size = _image_size(contents)
+    if size is None:
+        return 1
+    long_side = max(size)
+    for factor in (4, 2):
+        if long_side // factor >= ENROLL_DECODE_MIN_SIDE:
+            return factor
+    return 1
+
+
+def _decode_image(contents: bytes, reduced: int = 1) -> np.ndarray:
+    """Decode JPEG/PNG bytes, optionally at 1/2, 1/4 or 1/8 resolution."""
     arr = np.frombuffer(contents, np.uint8)
-    img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+    img = cv2.imdecode(arr, _IMREAD_FLAGS[reduced])
     if img is None:
         raise ValueError("Could not decode image. Ensure it is a valid JPEG or PNG.")
     return img
@@ -251,8 +503,9 @@ async def enroll_visitor(
       - file        (image: jpg/png)
     """
     contents = await file.read()
+    reduction = _enroll_reduction(contents)
     try:
-        image = _decode_image(contents)
+        image = _decode_image(contents, reduced=reduction)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
 
@@ -264,37 +517,79 @@ async def enroll_visitor(
             category=category,
         )
     except ValueError as exc:
-        raise HTTPException(status_code=422, detail=str(exc))
+        if reduction == 1:
+            raise HTTPException(status_code=422, detail=str(exc))
+        # Face may be too small at reduced resolution — retry at full size
+        try:
+            result = enrollment_manager.enroll(
+                visitor_id=visitor_id,
+                name=name,
+                image=_decode_image(contents),
+                category=category,
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=422, detail=str(exc))
 
     if not result["success"]:
         raise HTTPException(status_code=500, detail=result["message"])
 
-    # Reload embeddings so cameras pick up the new face immediately
-    recognition_engine.load_embeddings()
+    # Sync just this visitor so cameras pick up the new face immediately
+    recognition_engine.refresh_visitor(visitor_id)
 
-    return JSONResponse(content=result)
+    return result
 
 
 # ── Recognition ─────────────────────────────────────────
 
 @app.post("/recognize")
-async def recognize_face(
-    camera_id: str = Form("manual"),
-    file: UploadFile = File(...),
-):
+async def recognize_face(request: Request, camera_id: str = "manual"):
     """
-    Identify faces in an uploaded image (one-shot, not from live camera).
+    Identify faces in an image (one-shot, not from live camera).
+
+    The request body is the raw JPEG/PNG bytes (Content-Type: image/jpeg,
+    image/png or application/octet-stream); it is read straight from the
+    stream without a multipart tempfile. `camera_id` is a query parameter.
 
     Useful for testing / security desk manual check.
     """
-    contents = await file.read()
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith(("image/", "application/octet-stream")):
+        raise HTTPException(
+            status_code=415,
+            detail="Send raw image bytes, or use /recognize/form for multipart uploads.",
+        )
+
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail="Upload too large.")
+        chunks.append(chunk)
+
+    return await _recognize(b"".join(chunks), camera_id)
+
+
+@app.post("/recognize/form")
+async def recognize_face_form(
+    camera_id: str = Form("manual"),
+    file: UploadFile = File(...),
+):
+    """Multipart variant of /recognize (kept for backwards compatibility)."""
+    return await _recognize(await file.read(), camera_id)
+
+
+async def _recognize(contents: bytes, camera_id: str) -> dict:
     try:
         image = _decode_image(contents)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
 
-    import asyncio
-    matches = await asyncio.to_thread(recognition_engine.identify, image)
+    # Full-resolution upload: the engine detects on a downscaled copy and
+    # re-crops small faces from the original (see RecognitionEngine.max_side)
+    matches = await _run_recognition(image)
+    if matches is None:
+        raise HTTPException(status_code=503, detail="Recognition queue is full. Retry shortly.")
 
     results = [
         {
@@ -307,13 +602,13 @@ async def recognize_face(
         for m in matches
     ]
 
-    return JSONResponse(content={
+    return {
         "success": True,
         "camera_id": camera_id,
         "faces_detected": len(results),
         "results": results,
         "timestamp": datetime.now(timezone.utc).isoformat(),
-    })
+    }
 
 
 # ── Camera management ────────────────────────────────────
@@ -346,6 +641,8 @@ async def start_camera(camera_id: str):
 async def stop_camera(camera_id: str):
     """Stop a running camera worker."""
     ok = await camera_manager.stop(camera_id)
+    # The worker is gone, so nothing can read or refresh its cached matches
+    _last_recognised.pop(camera_id, None)
     if not ok:
         raise HTTPException(status_code=404, detail=f"Camera '{camera_id}' not running.")
     return {"success": True, "message": f"Camera '{camera_id}' stopped."}
@@ -389,7 +686,7 @@ async def delete_visitor(visitor_id: str):
     result = enrollment_manager.delete_visitor(visitor_id)
     if not result["success"]:
         raise HTTPException(status_code=404, detail=result["message"])
-    recognition_engine.load_embeddings()
+    recognition_engine.refresh_visitor(visitor_id)
     return result
 
 
@@ -463,16 +760,15 @@ async def get_geofence_alerts(limit: int = 50):
 
 @app.get("/stats")
 async def get_stats():
-    visitors = enrollment_manager.get_all_visitors()
     cameras = camera_manager.list()
-    alerts = behavior_analyzer.get_recent_alerts(limit=1000)
     return {
         "success": True,
         "stats": {
-            "enrolled_visitors": len(visitors),
+            "enrolled_visitors": enrollment_manager.count,
             "registered_cameras": len(cameras),
             "active_cameras": sum(1 for c in cameras.values() if c["active"]),
-            "total_alerts": len(alerts),
+            "total_alerts": behavior_analyzer.total_alerts,
+            "dropped_frames": batch_scheduler.dropped_frames,
             "timestamp": datetime.now(timezone.utc).isoformat(),
         },
     }
@@ -489,5 +785,9 @@ if __name__ == "__main__":
         host="127.0.0.1",
         port=8000,
         reload=False,   # reload=True breaks asyncio tasks — keep False
-        log_level="info",
+        workers=1,      # cameras/state live in-process — keep 1
+        loop="uvloop" if PRODUCTION else "auto",
+        http="httptools" if PRODUCTION else "auto",
+        log_level="warning" if PRODUCTION else "info",
+        access_log=not PRODUCTION,
     )
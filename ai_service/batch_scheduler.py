@@ -0,0 +1,181 @@
+"""
+batch_scheduler.py - Async micro-batcher for face recognition.
+
+Frames submitted by every CameraWorker (and the /recognize endpoint) are
+collected for a short window and handed to the recognition engine as a
+single `identify_batch(frames)` call, amortising the per-call Python and
+model-dispatch overhead across cameras.
+
+Inference runs on a dedicated executor (not the default thread pool shared
+with FastAPI), and the pending queue is bounded: when it is full the oldest
+frame is shed so latency stays bounded under camera bursts.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from concurrent.futures import Executor
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from recognition_engine import FaceMatch
+
+logger = logging.getLogger(__name__)
+
+# Signature: (frames) -> one list of matches per frame, in order
+BatchFn = Callable[[List[np.ndarray]], List[List[FaceMatch]]]
+
+# ──────────────────────────────────────────────────────────
+# Defaults (overridable via constructor)
+# ──────────────────────────────────────────────────────────
+
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT_MS = 15.0
+DEFAULT_MAX_QUEUE_SIZE = 16
+
+
+# ──────────────────────────────────────────────────────────
+# Scheduler
+# ──────────────────────────────────────────────────────────
+
+class BatchScheduler:
+    """
+    Coalesces concurrent recognition requests into batches.
+
+    A batch is dispatched as soon as `max_batch_size` frames are queued
+    or `max_wait_ms` has elapsed since the first frame of the batch
+    arrived, whichever comes first.
+
+    At most `max_queue_size` frames wait at any time. Submitting to a
+    full queue evicts the oldest pending frame, whose caller receives
+    None instead of a match list; `dropped_frames` counts evictions.
+    Frames still pending when the scheduler stops also receive None.
+
+    Usage
+    -----
+    scheduler = BatchScheduler(engine.identify_batch)
+    scheduler.start()                        # inside a running event loop
+    matches = await scheduler.submit(frame)  # None if shed under load
+    await scheduler.stop()
+    """
+
+    def __init__(
+        self,
+        batch_fn: BatchFn,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        self._batch_fn = batch_fn
+        self._executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.dropped_frames = 0
+
+        self._queue: asyncio.Queue[Tuple[np.ndarray, asyncio.Future]] = asyncio.Queue(
+            maxsize=max(1, max_queue_size),
+        )
+        self._task: Optional[asyncio.Task] = None
+        # Batch currently being collected or run, out of the queue already
+        self._inflight: List[Tuple[np.ndarray, asyncio.Future]] = []
+
+    # ----------------------------------------------------------
+    # Lifecycle
+    # ----------------------------------------------------------
+
+    def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run(), name="batch-scheduler")
+        logger.info("Batch scheduler started (max_batch=%d, max_wait=%.0fms).",
+                    self.max_batch_size, self.max_wait * 1000)
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # Resolve anything still waiting so callers don't hang forever: the
+        # batch the worker held when cancelled, then the queue. Like an
+        # evicted frame, each gets None rather than an exception.
+        pending = [future for _, future in self._inflight]
+        self._inflight = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait()[1])
+        for future in pending:
+            if not future.done():
+                future.set_result(None)
+
+    # ----------------------------------------------------------
+    # Public API
+    # ----------------------------------------------------------
+
+    async def submit(self, frame: np.ndarray) -> Optional[List[FaceMatch]]:
+        """
+        Queue one frame and wait for its identification results.
+
+        Never blocks on a full queue: the oldest pending frame is dropped
+        instead. Returns None if this frame is itself dropped later on, or
+        if the scheduler stops before it is processed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        if self._queue.full():
+            _, stale = self._queue.get_nowait()
+            if not stale.done():
+                stale.set_result(None)
+            self.dropped_frames += 1
+        self._queue.put_nowait((frame, future))
+        return await future
+
+    # ----------------------------------------------------------
+    # Internal helpers
+    # ----------------------------------------------------------
+
+    async def _collect(self) -> List[Tuple[np.ndarray, asyncio.Future]]:
+        """Block for the first item, then gather more until full or timed out."""
+        batch = self._inflight = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+
+            # Callers that gave up (e.g. camera stopped) don't need inference
+            batch = [(frame, fut) for frame, fut in batch if not fut.done()]
+            if not batch:
+                continue
+
+            frames = [frame for frame, _ in batch]
+            try:
+                results = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._batch_fn, frames,
+                )
+            except Exception as exc:
+                logger.warning("Batch recognition failed (size=%d): %s", len(frames), exc)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+
+            for (_, future), matches in zip(batch, results):
+                if not future.done():
+                    future.set_result(matches)
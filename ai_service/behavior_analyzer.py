@@ -7,18 +7,26 @@ Detects:
   - Unknown person presence
   - Re-entry without exit
 
-All generated alert events are persisted to MongoDB.
+All generated alert events are persisted to MongoDB. `analyze()` only
+buffers them in an EventWriteBuffer (write_buffer.py), whose background
+task inserts them in batches, so frame processing never waits on a Mongo
+round trip.
 """
 
 from __future__ import annotations
 
 import logging
-from collections import defaultdict
+import re
+import sys
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
 
 from db import events_col
+from write_buffer import EventWriteBuffer
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +37,29 @@ logger = logging.getLogger(__name__)
 DEFAULT_LOITERING_SECONDS = 60
 DEFAULT_DUPLICATE_SUPPRESSION_SECONDS = 30
 DEFAULT_UNKNOWN_ALERT_INTERVAL_SECONDS = 45
+DEFAULT_INSIDE_TTL_SECONDS = 8 * 3600
+
+# Event types produced by this analyzer
+_ALERT_TYPES = (
+    "restricted_zone_entry",
+    "unknown_person",
+    "re_entry_without_exit",
+)
+
+_ALERT_FILTER = {"event_type": {"$in": list(_ALERT_TYPES)}}
+_ALERT_PROJECTION = {
+    "_id": 0, "visitor_id": 1, "name": 1, "camera_id": 1, "location": 1,
+    "event_type": 1, "confidence": 1, "timestamp": 1,
+}
+# Matches the (event_type, timestamp) index from db.ensure_indexes()
+_ALERT_INDEX = [("event_type", ASCENDING), ("timestamp", DESCENDING)]
+
+# "Never" for per-camera timestamps
+_EPOCH_UTC = datetime.min.replace(tzinfo=timezone.utc)
+
+# Location labels are classified once per distinct label, not per frame
+_ENTRY_RE = re.compile(r"entry|entrance", re.IGNORECASE)
+_EXIT_RE = re.compile(r"exit", re.IGNORECASE)
 
 
 # ──────────────────────────────────────────────────────────
@@ -36,11 +67,37 @@ DEFAULT_UNKNOWN_ALERT_INTERVAL_SECONDS = 45
 # ──────────────────────────────────────────────────────────
 
 @dataclass
-class _PresenceState:
+class _EntityState:
+    """Everything analyze() needs for one (visitor_id, camera_id) pair."""
+
+    __slots__ = (
+        "first_seen", "last_seen", "location",
+        "last_restricted_emit", "last_unknown_emit", "last_reentry_emit",
+    )
+
     first_seen: datetime
     last_seen: datetime
-    camera_id: str
     location: str
+    last_restricted_emit: Optional[datetime]
+    last_unknown_emit: Optional[datetime]
+    last_reentry_emit: Optional[datetime]
+
+
+# Free list of evicted entity records, reused before allocating new ones
+_entity_pool: List[_EntityState] = []
+
+
+def _acquire_entity(now: datetime, location: str) -> _EntityState:
+    if _entity_pool:
+        state = _entity_pool.pop()
+        state.first_seen = now
+        state.last_seen = now
+        state.location = location
+        state.last_restricted_emit = None
+        state.last_unknown_emit = None
+        state.last_reentry_emit = None
+        return state
+    return _EntityState(now, now, location, None, None, None)
 
 
 # ──────────────────────────────────────────────────────────
@@ -52,7 +109,14 @@ class BehaviorAnalyzer:
     Stateful per-process behavior analyzer.
 
     Call `analyze()` once per detection frame. It returns a (possibly
-    empty) list of alert dicts that have already been persisted to DB.
+    empty) list of alert dicts; persistence happens in the background.
+
+    Usage
+    -----
+    analyzer = BehaviorAnalyzer()
+    analyzer.start()                # inside a running event loop
+    alerts = analyzer.analyze(...)
+    await analyzer.stop()           # writes out anything still buffered
     """
 
     def __init__(
@@ -60,24 +124,54 @@ class BehaviorAnalyzer:
         loitering_threshold_seconds: int = DEFAULT_LOITERING_SECONDS,
         duplicate_suppression_seconds: int = DEFAULT_DUPLICATE_SUPPRESSION_SECONDS,
         unknown_alert_interval_seconds: int = DEFAULT_UNKNOWN_ALERT_INTERVAL_SECONDS,
+        inside_ttl_seconds: int = DEFAULT_INSIDE_TTL_SECONDS,
     ) -> None:
         self._loitering_threshold = timedelta(seconds=loitering_threshold_seconds)
         self._dup_window = timedelta(seconds=duplicate_suppression_seconds)
         self._unknown_interval = timedelta(seconds=unknown_alert_interval_seconds)
+        self._inside_ttl = timedelta(seconds=inside_ttl_seconds)
 
-        # visitor_id → PresenceState  (camera-scoped: key = (visitor_id, camera_id))
-        self._presence: Dict[Tuple[str, str], _PresenceState] = {}
+        # camera_id → visitor_id → presence + last emit time per alert type.
+        # Nested rather than tuple-keyed so the hot path never builds a key
+        # tuple; both ids are interned, so their string hashes are reused.
+        # Entries idle past both the loitering threshold and the duplicate
+        # window are swept back into `_entity_pool` once per sweep period.
+        self._state: Dict[str, Dict[str, _EntityState]] = {}
+        self._sweep_period = max(self._loitering_threshold, self._dup_window)
+        self._last_sweep: Optional[datetime] = None
 
-        # (visitor_id, camera_id, event_type) → last emitted time
-        self._last_emitted: Dict[Tuple[str, str, str], datetime] = {}
+        # Track who is "inside" (entry seen, no exit yet) → last sighting.
+        # Visitor-scoped, not camera-scoped: entry and exit are usually
+        # different cameras. Visitors unseen for `inside_ttl` are presumed
+        # to have left unobserved and are dropped by the sweep.
+        self._inside: Dict[str, datetime] = {}
 
-        # Track who is "inside" (entry seen, no exit yet)
-        self._inside: Set[str] = set()
+        # Alerts emitted so far (seeded from DB by `refresh_alert_count`)
+        self.total_alerts = 0
 
-        # Last unknown alert per camera
-        self._last_unknown: Dict[str, datetime] = defaultdict(
-            lambda: datetime.min.replace(tzinfo=timezone.utc)
-        )
+        self._writer = EventWriteBuffer("Alert writer")
+
+        # location label → (is_entry, is_exit)
+        self._location_kind: Dict[str, Tuple[bool, bool]] = {}
+
+        # Last formatted timestamp: every match in a frame shares one datetime
+        self._iso_ts: Optional[datetime] = None
+        self._iso_str = ""
+
+        # Last unknown alert per camera (missing = never)
+        self._last_unknown: Dict[str, datetime] = {}
+
+    # ----------------------------------------------------------
+    # Lifecycle
+    # ----------------------------------------------------------
+
+    def start(self) -> None:
+        """Start the background alert writer."""
+        self._writer.start()
+
+    async def stop(self) -> None:
+        """Stop the writer and persist any alerts still buffered."""
+        await self._writer.stop()
 
     # ----------------------------------------------------------
     # Public API
@@ -119,30 +213,47 @@ class BehaviorAnalyzer:
         Returns
         -------
         List[Dict]
-            Alert event documents (already saved to DB).
+            Alert event documents (buffered for the background writer).
         """
-        now = timestamp or datetime.now(timezone.utc)
-        if now.tzinfo is None:
-            now = now.replace(tzinfo=timezone.utc)
-
-        alerts: List[Dict] = []
-        pk = (visitor_id, camera_id)
+        if timestamp is None:
+            now = datetime.now(timezone.utc)
+        elif timestamp.tzinfo is None:
+            now = timestamp.replace(tzinfo=timezone.utc)
+        else:
+            now = timestamp
 
         # Update presence state
-        if pk not in self._presence:
-            self._presence[pk] = _PresenceState(now, now, camera_id, location)
+        camera_state = self._state.get(camera_id)
+        if camera_state is None:
+            camera_id = sys.intern(camera_id)
+            camera_state = self._state[camera_id] = {}
+        state = camera_state.get(visitor_id)
+        if state is None:
+            state = camera_state[sys.intern(visitor_id)] = _acquire_entity(now, location)
         else:
-            self._presence[pk].last_seen = now
-            self._presence[pk].location = location
+            state.last_seen = now
+            state.location = location
+        self._sweep_state(now)
+
+        # Fast path: a known visitor in a general zone at a location that is
+        # neither entry nor exit can't raise anything, whatever the timing.
+        restricted = zone_type == "restricted" or zone_type.lower() == "restricted"
+        if visitor_id != "unknown" and not restricted:
+            is_entry, is_exit = self._classify_location(location)
+            if not (is_entry or is_exit):
+                if visitor_id in self._inside:
+                    self._inside[visitor_id] = now
+                return []
 
-        dwell = self._presence[pk].last_seen - self._presence[pk].first_seen
+        alerts: List[Dict] = []
 
         # Note: Generic camera-level loitering has been REMOVED.
         # Use geofence_monitor.py for spatial loitering detection instead.
 
         # 1. Restricted zone entry (fire on every new arrival window)
-        if zone_type.lower() == "restricted":
-            if self._should_emit(visitor_id, camera_id, "restricted_zone_entry", now):
+        if restricted:
+            if self._should_emit(state.last_restricted_emit, now):
+                state.last_restricted_emit = now
                 alerts.append(self._emit(
                     visitor_id, name, camera_id, location,
                     "restricted_zone_entry", confidence, now
@@ -150,8 +261,9 @@ class BehaviorAnalyzer:
 
         # 2. Unknown person
         if visitor_id == "unknown":
-            if (now - self._last_unknown[camera_id]) >= self._unknown_interval:
-                if self._should_emit(visitor_id, camera_id, "unknown_person", now):
+            if (now - self._last_unknown.get(camera_id, _EPOCH_UTC)) >= self._unknown_interval:
+                if self._should_emit(state.last_unknown_emit, now):
+                    state.last_unknown_emit = now
                     self._last_unknown[camera_id] = now
                     alerts.append(self._emit(
                         visitor_id, name, camera_id, location,
@@ -161,48 +273,67 @@ class BehaviorAnalyzer:
         # 3. Re-entry without exit (only for known visitors)
         if visitor_id != "unknown":
             self._check_entry_exit(visitor_id, name, camera_id, location,
-                                   confidence, now, alerts)
+                                   confidence, now, alerts, state)
 
         return alerts
 
     def get_recent_alerts(self, limit: int = 100) -> List[Dict]:
         """Fetch persisted alerts from MongoDB."""
-        alert_types = {
-            "restricted_zone_entry",
-            "unknown_person",
-            "re_entry_without_exit",
-        }
-        projection = {"_id": 0}
         cursor = (
             events_col()
-            .find({"event_type": {"$in": list(alert_types)}}, projection)
+            .find(_ALERT_FILTER, _ALERT_PROJECTION)
+            .hint(_ALERT_INDEX)
             .sort("timestamp", -1)
             .limit(limit)
+            .batch_size(limit)
         )
-        results = []
-        for doc in cursor:
+        results = list(cursor)
+        for doc in results:
             if isinstance(doc.get("timestamp"), datetime):
                 doc["timestamp"] = doc["timestamp"].isoformat()
-            results.append(doc)
         return results
 
+    def refresh_alert_count(self) -> int:
+        """Re-read the persisted alert count from MongoDB. Call at startup."""
+        self.total_alerts = events_col().count_documents(_ALERT_FILTER)
+        return self.total_alerts
+
     # ----------------------------------------------------------
     # Internal helpers
     # ----------------------------------------------------------
 
-    def _should_emit(
-        self,
-        visitor_id: str,
-        camera_id: str,
-        event_type: str,
-        now: datetime,
-    ) -> bool:
-        key = (visitor_id, camera_id, event_type)
-        prev = self._last_emitted.get(key)
-        if prev and (now - prev) < self._dup_window:
-            return False
-        self._last_emitted[key] = now
-        return True
+    def _sweep_state(self, now: datetime) -> None:
+        """Evict idle entity records (back to the pool) and stale `_inside` entries."""
+        if self._last_sweep is None:
+            self._last_sweep = now
+            return
+        if now - self._last_sweep < self._sweep_period:
+            return
+        self._last_sweep = now
+
+        cutoff = now - self._sweep_period
+        for camera_state in self._state.values():
+            stale = [vid for vid, st in camera_state.items() if st.last_seen < cutoff]
+            for vid in stale:
+                _entity_pool.append(camera_state.pop(vid))
+
+        inside_cutoff = now - self._inside_ttl
+        for vid in [v for v, seen in self._inside.items() if seen < inside_cutoff]:
+            del self._inside[vid]
+
+    def _classify_location(self, location: str) -> Tuple[bool, bool]:
+        """(is_entry, is_exit) for a location label, memoised per label."""
+        kind = self._location_kind.get(location)
+        if kind is None:
+            kind = self._location_kind[location] = (
+                _ENTRY_RE.search(location) is not None,
+                _EXIT_RE.search(location) is not None,
+            )
+        return kind
+
+    def _should_emit(self, last_emitted: Optional[datetime], now: datetime) -> bool:
+        """False while still inside the duplicate-suppression window."""
+        return last_emitted is None or (now - last_emitted) >= self._dup_window
 
     def _emit(
         self,
@@ -215,6 +346,13 @@ class BehaviorAnalyzer:
         timestamp: datetime,
         extra: Optional[Dict] = None,
     ) -> Dict:
+        if timestamp is not self._iso_ts:
+            self._iso_ts = timestamp
+            self._iso_str = timestamp.isoformat()
+
+        # Caller-facing payload (JSON-ready) and DB document are built once
+        # each; the DB copy carries its own _id so the driver never has to
+        # inject one, and nothing is mutated after being buffered.
         doc = {
             "visitor_id": visitor_id,
             "name": name,
@@ -222,18 +360,14 @@ class BehaviorAnalyzer:
             "location": location,
             "event_type": event_type,
             "confidence": round(confidence, 4),
-            "timestamp": timestamp,
+            "timestamp": self._iso_str,
         }
         if extra:
             doc.update(extra)
 
-        try:
-            events_col().insert_one(doc)
-        except Exception as exc:
-            logger.warning("Alert insert failed: %s", exc)
+        self._writer.append({**doc, "_id": ObjectId(), "timestamp": timestamp})
 
-        doc.pop("_id", None)
-        doc["timestamp"] = timestamp.isoformat()
+        self.total_alerts += 1
         logger.info("ALERT [%s] visitor=%s camera=%s", event_type, visitor_id, camera_id)
         return doc
 
@@ -246,19 +380,21 @@ class BehaviorAnalyzer:
         confidence: float,
         now: datetime,
         alerts: List[Dict],
+        state: _EntityState,
     ) -> None:
-        lower = location.lower()
-        is_entry = "entry" in lower or "entrance" in lower
-        is_exit = "exit" in lower
+        is_entry, is_exit = self._classify_location(location)
 
         if is_entry:
             if visitor_id in self._inside:
-                if self._should_emit(visitor_id, camera_id, "re_entry_without_exit", now):
+                if self._should_emit(state.last_reentry_emit, now):
+                    state.last_reentry_emit = now
                     alerts.append(self._emit(
                         visitor_id, name, camera_id, location,
                         "re_entry_without_exit", confidence, now
                     ))
-            self._inside.add(visitor_id)
+            self._inside[visitor_id] = now
 
-        if is_exit and visitor_id in self._inside:
-            self._inside.discard(visitor_id)
+        if is_exit:
+            self._inside.pop(visitor_id, None)
+        elif not is_entry and visitor_id in self._inside:
+            self._inside[visitor_id] = now
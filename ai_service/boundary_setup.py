@@ -12,14 +12,21 @@ Instructions:
 """
 
 import argparse
+import hashlib
 import json
 import os
+import sys
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import cv2
 import numpy as np
 
+LABEL_FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+# Must match camera_manager's webcam format so points land on the same pixels
+WEBCAM_FRAME_SIZE = (640, 480)
+
 
 class BoundaryDrawer:
     """Interactive polygon drawing tool for geofence boundaries."""
@@ -31,45 +38,85 @@ class BoundaryDrawer:
         self.drawing = False
         self.window_name = f"Boundary Setup - Camera: {camera_id}"
 
+        # Polygon layer cache, rebuilt only when the points or frame size change
+        self._points_rev = 0
+        self._cached_key: Optional[Tuple[int, Tuple[int, ...]]] = None
+        self._roi: Optional[Tuple[slice, slice]] = None
+        self._layer: Optional[np.ndarray] = None
+        self._mask: Optional[np.ndarray] = None
+        # (point, label text, label origin) per point
+        self._labels: List[Tuple[Tuple[int, int], str, Tuple[int, int]]] = []
+
+        # Digest of the last point set written to disk
+        self._last_saved_hash: Optional[bytes] = None
+
     def mouse_callback(self, event, x, y, flags, param):
         """Handle mouse clicks to add boundary points."""
         if event == cv2.EVENT_LBUTTONDOWN:
             self.points.append((x, y))
+            self._points_rev += 1
             print(f"Point added: ({x}, {y}) | Total points: {len(self.points)}")
 
+    def clear_points(self):
+        self.points.clear()
+        self._points_rev += 1
+
     def draw_overlay(self, frame: np.ndarray) -> np.ndarray:
-        """Draw the boundary polygon and points on the frame."""
-        overlay = frame.copy()
-
-        # Draw lines between points
-        if len(self.points) > 1:
-            for i in range(len(self.points) - 1):
-                cv2.line(overlay, self.points[i], self.points[i + 1], (0, 255, 0), 2)
-            # Close the polygon
-            if len(self.points) > 2:
-                cv2.line(overlay, self.points[-1], self.points[0], (0, 255, 0), 2)
-
-        # Draw filled polygon with transparency
-        if len(self.points) > 2:
-            pts = np.array(self.points, np.int32).reshape((-1, 1, 2))
-            cv2.fillPoly(overlay, [pts], (0, 255, 0))
-            frame = cv2.addWeighted(frame, 0.7, overlay, 0.3, 0)
+        """
+        Draw the boundary polygon and points on the frame (in place).
+
+        The filled polygon is pre-rendered into a layer cropped to its
+        bounding box; each frame only blends that region, instead of
+        copying and re-rasterising the whole frame.
+        """
+        key = (self._points_rev, frame.shape)
+        if key != self._cached_key:
+            self._rebuild_layer(frame.shape)
+            self._cached_key = key
+
+        # Blend the polygon layer at 30% opacity, inside the polygon only
+        if self._roi is not None:
+            roi = frame[self._roi]
+            blended = cv2.addWeighted(roi, 0.7, self._layer, 0.3, 0)
+            cv2.copyTo(blended, self._mask, roi)
 
         # Draw points as circles
-        for i, point in enumerate(self.points):
+        for point, text, origin in self._labels:
             cv2.circle(frame, point, 5, (0, 0, 255), -1)
-            cv2.putText(
-                frame,
-                str(i + 1),
-                (point[0] + 10, point[1] - 10),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.5,
-                (255, 255, 255),
-                1,
-            )
+            cv2.putText(frame, text, origin, LABEL_FONT, 0.5, (255, 255, 255), 1)
 
         return frame
 
+    def _rebuild_layer(self, shape: Tuple[int, ...]) -> None:
+        """Rasterise outline + fill once into a bbox-sized layer and mask."""
+        self._labels = [
+            (point, str(i + 1), (point[0] + 10, point[1] - 10))
+            for i, point in enumerate(self.points)
+        ]
+        self._roi = self._layer = self._mask = None
+        if len(self.points) < 3:
+            return
+
+        height, width = shape[:2]
+        pts = np.array(self.points, np.int32).reshape((-1, 1, 2))
+        x, y, w, h = cv2.boundingRect(pts)
+        # Pad for the 2px outline, then clip to the frame
+        x0, y0 = max(x - 2, 0), max(y - 2, 0)
+        x1, y1 = min(x + w + 2, width), min(y + h + 2, height)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        local = pts - np.array([x0, y0], np.int32)
+        layer = np.zeros((y1 - y0, x1 - x0, 3), np.uint8)
+        mask = np.zeros((y1 - y0, x1 - x0), np.uint8)
+        for target, color in ((layer, (0, 255, 0)), (mask, 255)):
+            cv2.polylines(target, [local], True, color, 2)
+            cv2.fillPoly(target, [local], color)
+
+        self._roi = (slice(y0, y1), slice(x0, x1))
+        self._layer = layer
+        self._mask = mask
+
     def save_boundary(self) -> bool:
         """Save the boundary points to a JSON file."""
         if len(self.points) < 3:
@@ -80,17 +127,24 @@ class BoundaryDrawer:
         boundaries_dir = Path("boundaries")
         boundaries_dir.mkdir(exist_ok=True)
 
-        # Save to JSON
         filepath = boundaries_dir / f"{self.camera_id}_boundary.json"
+
+        digest = hashlib.blake2b(repr(self.points).encode()).digest()
+        if digest == self._last_saved_hash and filepath.exists():
+            print(f"✅ Boundary unchanged: {filepath}")
+            return True
+
+        # Save to JSON via a temp file so readers never see a partial write
         data = {
             "camera_id": self.camera_id,
             "source": str(self.source),
             "points": self.points,
             "num_points": len(self.points),
         }
-
-        with open(filepath, "w") as f:
-            json.dump(data, f, indent=2)
+        tmp = filepath.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(data, separators=(",", ":")))
+        os.replace(tmp, filepath)
+        self._last_saved_hash = digest
 
         print(f"✅ Boundary saved to: {filepath}")
         return True
@@ -101,7 +155,11 @@ class BoundaryDrawer:
         if isinstance(self.source, str) and not self.source.isdigit():
             cap = cv2.VideoCapture(self.source)
         else:
-            cap = cv2.VideoCapture(int(self.source))
+            api = cv2.CAP_DSHOW if sys.platform == "win32" else cv2.CAP_ANY
+            cap = cv2.VideoCapture(int(self.source), api)
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, WEBCAM_FRAME_SIZE[0])
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, WEBCAM_FRAME_SIZE[1])
 
         if not cap.isOpened():
             print(f"❌ Cannot open camera/video source: {self.source}")
@@ -151,7 +209,7 @@ class BoundaryDrawer:
                 print("🚪 Quit without saving")
                 break
             elif key == ord("c"):
-                self.points.clear()
+                self.clear_points()
                 print("🗑️  All points cleared")
             elif key == ord("s"):
                 if self.save_boundary():
@@ -6,31 +6,71 @@ Supports:
   - Video file (source_type="video", source_value="path/to/file.mp4")
   - RTSP stream (source_type="rtsp", source_value="rtsp://...")
 
-Each camera runs in its own asyncio Task. Frames are forwarded to the
-`on_frame` callback supplied at construction.
+Each camera has one reader thread that owns the capture device and one
+asyncio Task that forwards frames to the `on_frame` callback supplied at
+construction. An optional `preprocess` hook (e.g. downscaling) runs on
+the reader thread, so only the small frame crosses into the recognition
+queues.
+
+Workers decode into a small pool of reused buffers, so `on_frame` must
+finish with the frame before it returns (or copy whatever it keeps).
 """
 
 from __future__ import annotations
 
 import asyncio
 import logging
+import sys
+import threading
+import time
+from collections import deque
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Awaitable, Callable, Dict, Optional, Union
+from typing import (
+    Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple, Union,
+)
 
 import cv2
 import numpy as np
 
+from pymongo import UpdateOne
+
 from db import cameras_col
 
 logger = logging.getLogger(__name__)
 
-# Signature: (camera_id, location, zone_type, timestamp, frame) -> None
+# Signature: (camera_id, location, zone_type, timestamp, frame, scale) -> None
+# `scale` maps frame coordinates back to the source: source = frame / scale
+# `frame` may be a reused buffer: it is only valid until the callback returns
 FrameCallback = Callable[
-    [str, str, str, datetime, np.ndarray],
+    [str, str, str, datetime, np.ndarray, float],
     Awaitable[None],
 ]
 
+# Signature: (frame) -> (processed_frame, scale)
+FramePreprocessor = Callable[[np.ndarray], Tuple[np.ndarray, float]]
+
+# (timestamp, frame, scale, buffer slot) as handed from reader thread to loop
+_QueuedFrame = Tuple[datetime, np.ndarray, float, List[Optional[np.ndarray]]]
+
+# Frames waiting for on_frame; beyond this the oldest is dropped
+FRAME_QUEUE_SIZE = 2
+
+# Seconds stop() waits for the reader thread to release the device
+READER_JOIN_TIMEOUT = 2.0
+
+# Give up connecting to an RTSP stream after this long
+RTSP_OPEN_TIMEOUT_MS = 5000
+
+# Webcams are asked for compressed MJPG at recognition resolution, instead
+# of the driver default (often raw YUYV at full resolution). boundary_setup.py
+# opens webcams the same way so drawn geofences match these pixels.
+WEBCAM_FOURCC = cv2.VideoWriter_fourcc(*"MJPG")
+WEBCAM_FRAME_SIZE = (640, 480)
+
+# DirectShow opens faster and honours the format hints on Windows
+_WEBCAM_API = cv2.CAP_DSHOW if sys.platform == "win32" else cv2.CAP_ANY
+
 
 # ──────────────────────────────────────────────────────────
 # Config dataclass
@@ -58,14 +98,37 @@ class CameraConfig:
 # ──────────────────────────────────────────────────────────
 
 class CameraWorker:
-    """Reads frames from one source and fires the on_frame callback."""
-
-    def __init__(self, config: CameraConfig, on_frame: FrameCallback) -> None:
+    """
+    Reads frames from one source and fires the on_frame callback.
+
+    A dedicated reader thread owns the VideoCapture: it opens the source,
+    reads/preprocesses frames at `target_fps` and hands them to the event
+    loop through a small queue. The worker's asyncio task only awaits that
+    queue and calls `on_frame`, so no executor hop is paid per frame.
+    When the callback falls behind, the oldest queued frame is dropped.
+    """
+
+    def __init__(
+        self,
+        config: CameraConfig,
+        on_frame: FrameCallback,
+        preprocess: Optional[FramePreprocessor] = None,
+    ) -> None:
         self.config = config
         self._on_frame = on_frame
+        self._preprocess = preprocess
         self._task: Optional[asyncio.Task] = None
+        self._reader: Optional[threading.Thread] = None
+        self._queue: Optional[asyncio.Queue] = None
         self._running = False
 
+        # Free list of [read_buf, flip_buf] pairs that OpenCV decodes/flips
+        # into in place. A slot travels with its frame and comes back once
+        # on_frame returns (or the frame is dropped), so at most
+        # FRAME_QUEUE_SIZE + 2 slots ever exist. A slot whose on_frame is
+        # cancelled is never reused.
+        self._slots: Deque[List[Optional[np.ndarray]]] = deque()
+
     def start(self) -> None:
         if self._running:
             return
@@ -87,45 +150,147 @@ class CameraWorker:
                 await self._task
             except asyncio.CancelledError:
                 pass
+        if self._reader:
+            # Let the reader finish its current read and release the device
+            await asyncio.to_thread(self._reader.join, READER_JOIN_TIMEOUT)
+            self._reader = None
         logger.info("Camera '%s' stopped.", self.config.camera_id)
 
     @property
     def is_running(self) -> bool:
         return self._running and self._task is not None and not self._task.done()
 
-    async def _run(self) -> None:
+    # ----------------------------------------------------------
+    # Reader thread
+    # ----------------------------------------------------------
+
+    def _grab(
+        self,
+        capture: cv2.VideoCapture,
+        slot: List[Optional[np.ndarray]],
+    ) -> Tuple[bool, Optional[np.ndarray], float]:
+        """Read, flip and preprocess one frame into `slot`'s buffers."""
+        ret, frame = capture.read(slot[0])
+        if not ret:
+            return False, None, 1.0
+        slot[0] = frame
+
+        # Flip frame horizontally for webcams (fixes mirror image)
+        if self.config.source_type == "webcam":
+            frame = slot[1] = cv2.flip(frame, 1, slot[1])
+
+        if self._preprocess is None:
+            return True, frame, 1.0
+        frame, scale = self._preprocess(frame)
+        return True, frame, scale
+
+    def _open_capture(self, source: Union[int, str]) -> cv2.VideoCapture:
+        """
+        Open the source with decode hints.
+
+        Files and streams go through FFmpeg with hardware decoding requested
+        (falls back to software when no GPU/VPU decoder is available).
+        Webcams are asked for MJPG at WEBCAM_FRAME_SIZE; drivers that can't
+        comply keep their defaults. Every source keeps a 1-frame driver
+        buffer, so a slow consumer reads a current frame instead of a backlog.
+        """
+        if self.config.source_type in ("rtsp", "video"):
+            params = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+            if self.config.source_type == "rtsp":
+                params += [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, RTSP_OPEN_TIMEOUT_MS]
+            capture = cv2.VideoCapture(source, cv2.CAP_FFMPEG, params)
+        else:
+            capture = cv2.VideoCapture(source, _WEBCAM_API)
+            # FOURCC must be set before the size for some V4L2/DShow drivers
+            capture.set(cv2.CAP_PROP_FOURCC, WEBCAM_FOURCC)
+            capture.set(cv2.CAP_PROP_FRAME_WIDTH, WEBCAM_FRAME_SIZE[0])
+            capture.set(cv2.CAP_PROP_FRAME_HEIGHT, WEBCAM_FRAME_SIZE[1])
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return capture
+
+    def _read_loop(self, loop: asyncio.AbstractEventLoop) -> None:
         source = self.config.to_cv2_source()
-        capture = cv2.VideoCapture(source)
+        capture = self._open_capture(source)
 
-        if not capture.isOpened():
-            logger.error("Cannot open camera '%s' (source=%s).",
-                         self.config.camera_id, source)
-            self._running = False
-            return
+        try:
+            if not capture.isOpened():
+                logger.error("Cannot open camera '%s' (source=%s).",
+                             self.config.camera_id, source)
+                return
 
-        frame_interval = 1.0 / max(1.0, self.config.target_fps)
+            frame_interval = 1.0 / max(1.0, self.config.target_fps)
 
-        try:
             while self._running:
-                t0 = asyncio.get_running_loop().time()
+                t0 = time.monotonic()
 
-                ret, frame = await asyncio.to_thread(capture.read)
+                slot = self._slots.popleft() if self._slots else [None, None]
+                ret, frame, scale = self._grab(capture, slot)
 
                 if not ret:
+                    self._slots.append(slot)
                     if self.config.source_type == "video":
                         # Loop video file for demo purposes
                         capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                        await asyncio.sleep(0.1)
+                        time.sleep(0.1)
                         continue
                     # Webcam/RTSP read failure – retry briefly
-                    await asyncio.sleep(0.5)
+                    time.sleep(0.5)
                     continue
 
-                # Flip frame horizontally for webcams (fixes mirror image)
-                if self.config.source_type == "webcam":
-                    frame = cv2.flip(frame, 1)
+                item = (datetime.now(timezone.utc), frame, scale, slot)
+                try:
+                    loop.call_soon_threadsafe(self._push, item)
+                except RuntimeError:
+                    if not loop.is_closed():
+                        logger.exception("Cannot hand frame to event loop (camera=%s).",
+                                         self.config.camera_id)
+                    # Otherwise the loop closed underneath us (process shutting down)
+                    break
+
+                sleep_for = frame_interval - (time.monotonic() - t0)
+                if sleep_for > 0:
+                    time.sleep(sleep_for)
+        except Exception:
+            logger.exception("Reader thread failed (camera=%s).", self.config.camera_id)
+        finally:
+            capture.release()
+            try:
+                loop.call_soon_threadsafe(self._push, None)
+            except RuntimeError:
+                if not loop.is_closed():
+                    logger.exception("Cannot signal end of stream (camera=%s).",
+                                     self.config.camera_id)
+
+    # ----------------------------------------------------------
+    # Event loop side
+    # ----------------------------------------------------------
+
+    def _push(self, item: Optional[_QueuedFrame]) -> None:
+        """Enqueue from the reader thread (runs on the loop). None = reader exited."""
+        if self._queue is None:
+            return
+        if self._queue.full():
+            stale = self._queue.get_nowait()
+            if stale is not None:
+                self._slots.append(stale[3])
+        self._queue.put_nowait(item)
+
+    async def _run(self) -> None:
+        self._queue = asyncio.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self._reader = threading.Thread(
+            target=self._read_loop,
+            args=(asyncio.get_running_loop(),),
+            name=f"grab-{self.config.camera_id}",
+            daemon=True,
+        )
+        self._reader.start()
 
-                timestamp = datetime.now(timezone.utc)
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is None:
+                    break
+                timestamp, frame, scale, slot = item
 
                 try:
                     await self._on_frame(
@@ -134,18 +299,20 @@ class CameraWorker:
                         self.config.zone_type,
                         timestamp,
                         frame,
+                        scale,
                     )
+                except asyncio.CancelledError:
+                    # The frame may still be queued for, or running,
+                    # inference: drop its slot instead of letting the reader
+                    # decode the next frame into it
+                    raise
                 except Exception as exc:
                     logger.warning("on_frame error (camera=%s): %s",
                                    self.config.camera_id, exc)
-
-                elapsed = asyncio.get_running_loop().time() - t0
-                sleep_for = max(0.0, frame_interval - elapsed)
-                if sleep_for:
-                    await asyncio.sleep(sleep_for)
+                self._slots.append(slot)
         finally:
-            capture.release()
             self._running = False
+            self._queue = None
 
 
 # ──────────────────────────────────────────────────────────
@@ -155,8 +322,13 @@ class CameraWorker:
 class CameraManager:
     """Registers, starts, and stops camera workers."""
 
-    def __init__(self, on_frame: FrameCallback) -> None:
+    def __init__(
+        self,
+        on_frame: FrameCallback,
+        preprocess: Optional[FramePreprocessor] = None,
+    ) -> None:
         self._on_frame = on_frame
+        self._preprocess = preprocess
         self._configs: Dict[str, CameraConfig] = {}
         self._workers: Dict[str, CameraWorker] = {}
 
@@ -166,20 +338,37 @@ class CameraManager:
 
     def register(self, config: CameraConfig) -> None:
         """Persist config to DB and store in memory."""
-        self._configs[config.camera_id] = config
-
-        doc = {
-            "camera_id": config.camera_id,
-            "source_type": config.source_type,
-            "source_value": str(config.source_value),
-            "location": config.location,
-            "zone_type": config.zone_type,
-            "target_fps": config.target_fps,
-        }
-        cameras_col().replace_one(
-            {"camera_id": config.camera_id}, doc, upsert=True
-        )
-        logger.info("Camera '%s' registered.", config.camera_id)
+        self.register_many([config])
+
+    def register_many(self, configs: Iterable[CameraConfig]) -> int:
+        """Persist several configs with one unordered bulk_write. Returns the count."""
+        configs = list(configs)
+        if not configs:
+            return 0
+        self._configs.update((c.camera_id, c) for c in configs)
+
+        # $set leaves an unchanged document untouched (no write on re-register)
+        now = datetime.now(timezone.utc)
+        ops = [
+            UpdateOne(
+                {"camera_id": c.camera_id},
+                {
+                    "$set": {
+                        "source_type": c.source_type,
+                        "source_value": str(c.source_value),
+                        "location": c.location,
+                        "zone_type": c.zone_type,
+                        "target_fps": c.target_fps,
+                    },
+                    "$setOnInsert": {"created_at": now},
+                },
+                upsert=True,
+            )
+            for c in configs
+        ]
+        cameras_col().bulk_write(ops, ordered=False)
+        logger.info("Camera(s) registered: %s", ", ".join(c.camera_id for c in configs))
+        return len(configs)
 
     def remove(self, camera_id: str) -> None:
         self._configs.pop(camera_id, None)
@@ -199,7 +388,11 @@ class CameraManager:
             logger.warning("Camera '%s' not registered.", camera_id)
             return False
 
-        worker = CameraWorker(config=config, on_frame=self._on_frame)
+        worker = CameraWorker(
+            config=config,
+            on_frame=self._on_frame,
+            preprocess=self._preprocess,
+        )
         self._workers[camera_id] = worker
         worker.start()
         return True
@@ -23,6 +23,7 @@ MONGO_URI: str = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 DB_NAME: str = os.getenv("DB_NAME", "smart_vms")
 
 _client: Optional[MongoClient] = None
+_db: Optional[Database] = None
 
 
 def get_client() -> MongoClient:
@@ -33,26 +34,44 @@ def get_client() -> MongoClient:
 
 
 def get_db() -> Database:
-    return get_client()[DB_NAME]
+    global _db
+    if _db is None:
+        _db = get_client()[DB_NAME]
+    return _db
 
 
 # ──────────────────────────────────────────────────────────
 # Collection accessors
 # ──────────────────────────────────────────────────────────
 
+# Handles are resolved once; accessors sit on the per-frame write path
+_embeddings_col: Optional[Collection] = None
+_events_col: Optional[Collection] = None
+_cameras_col: Optional[Collection] = None
+
+
 def embeddings_col() -> Collection:
     """Stores face embeddings for enrolled visitors."""
-    return get_db()["embeddings"]
+    global _embeddings_col
+    if _embeddings_col is None:
+        _embeddings_col = get_db()["embeddings"]
+    return _embeddings_col
 
 
 def events_col() -> Collection:
     """Stores all detection and alert events."""
-    return get_db()["events"]
+    global _events_col
+    if _events_col is None:
+        _events_col = get_db()["events"]
+    return _events_col
 
 
 def cameras_col() -> Collection:
     """Stores camera configuration."""
-    return get_db()["cameras"]
+    global _cameras_col
+    if _cameras_col is None:
+        _cameras_col = get_db()["cameras"]
+    return _cameras_col
 
 
 # ──────────────────────────────────────────────────────────
@@ -80,7 +99,10 @@ embeddings collection:
 {
     "visitor_id":  str,          # unique
     "name":        str,
-    "embedding":   list[float],  # ArcFace vector (512-dim)
+    "embedding":   Binary,       # ArcFace vector (512-dim), packed bytes
+                                 # (legacy docs: list[float])
+    "embedding_dtype": str,      # "float16"
+    "embedding_dim":   int,
     "category":    str,          # "visitor" | "staff" | "vip"
     "created_at":  datetime (UTC)
 }
@@ -0,0 +1,33 @@
+"""
+embedding_utils.py - Shared helpers for ArcFace embedding vectors.
+
+Embeddings are L2-normalised once, where they enter the system (enrollment
+and recognition), so every later comparison is a plain dot product.
+"""
+
+from __future__ import annotations
+
+import math
+
+import numpy as np
+
+
+# ──────────────────────────────────────────────────────────
+# Normalisation
+# ──────────────────────────────────────────────────────────
+
+def l2_normalise(vector: np.ndarray) -> np.ndarray:
+    """Unit-length float32 copy of a 1-D vector (zero vectors are returned as-is)."""
+    vector = np.array(vector, dtype=np.float32)
+    # A dot product and an in-place scale beat np.linalg.norm + divide at 512-d
+    norm = math.sqrt(float(vector @ vector))
+    if norm > 0:
+        vector *= 1.0 / norm
+    return vector
+
+
+def l2_normalise_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalise each row of a (K, D) matrix into a contiguous float32 copy."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.ascontiguousarray(vectors / np.where(norms > 0, norms, 1.0))
@@ -3,18 +3,27 @@ enrollment_manager.py - Visitor enrollment into MongoDB.
 
 Accepts a raw image (numpy array), extracts an ArcFace embedding
 via DeepFace, then upserts the record into the embeddings collection.
+When given an embedder (the service passes `RecognitionEngine.embed_face`),
+enrollment uses it instead, so enrolled vectors are in the same space as
+the probes they are matched against; each record is tagged with the
+embedder's `embedding_model`.
+Batches of visitors (e.g. a staff import) are written with one unordered
+`bulk_write` instead of a round-trip per visitor.
 """
 
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 
 import numpy as np
+from bson.binary import Binary
 from deepface import DeepFace
-from pymongo.errors import PyMongoError
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError, PyMongoError
 
 from db import embeddings_col
+from embedding_utils import l2_normalise
 
 
 # ──────────────────────────────────────────────────────────
@@ -24,6 +33,15 @@ from db import embeddings_col
 MODEL_NAME = "ArcFace"
 DETECTOR_BACKEND = "retinaface"
 
+# Embeddings are stored as packed bytes of this dtype (bson Binary)
+EMBEDDING_DTYPE = "float16"
+
+# (visitor_id, name, BGR image, category)
+EnrollRecord = Tuple[str, str, np.ndarray, str]
+
+# BGR image -> normalised embedding; raises ValueError when no face is found
+Embedder = Callable[[np.ndarray], np.ndarray]
+
 
 # ──────────────────────────────────────────────────────────
 # Public API
@@ -32,6 +50,26 @@ DETECTOR_BACKEND = "retinaface"
 class EnrollmentManager:
     """Enroll visitors and manage the embeddings collection."""
 
+    def __init__(
+        self,
+        embedder: Optional[Embedder] = None,
+        embedding_model: str = MODEL_NAME,
+    ) -> None:
+        self._embedder = embedder
+        # Stored on every record; the recognition engine only loads its own
+        self.embedding_model = embedding_model
+        self._count = 0
+
+    @property
+    def count(self) -> int:
+        """Number of enrolled visitors, tracked in memory (see `refresh_count`)."""
+        return self._count
+
+    def refresh_count(self) -> int:
+        """Re-read the enrolled-visitor count from MongoDB. Call at startup."""
+        self._count = embeddings_col().count_documents({})
+        return self._count
+
     # ----------------------------------------------------------
     # Enrollment
     # ----------------------------------------------------------
@@ -50,29 +88,34 @@ class EnrollmentManager:
         Raises ValueError if no face is detected.
         """
         embedding = self._extract_embedding(image)
+        doc = self._build_doc(visitor_id, name, embedding, category, datetime.now(timezone.utc))
+        return self._upsert([doc])[0]
 
-        doc = {
-            "visitor_id": visitor_id,
-            "name": name,
-            "embedding": embedding.tolist(),
-            "category": category,
-            "created_at": datetime.now(timezone.utc),
-        }
-
-        try:
-            embeddings_col().replace_one(
-                {"visitor_id": visitor_id},
-                doc,
-                upsert=True,
-            )
-        except PyMongoError as exc:
-            return {"success": False, "message": f"Database error: {exc}", "visitor_id": visitor_id}
+    def enroll_many(self, records: Sequence[EnrollRecord]) -> List[Dict]:
+        """
+        Enroll several visitors with a single unordered bulk write.
 
-        return {
-            "success": True,
-            "message": f"Visitor '{name}' enrolled successfully.",
-            "visitor_id": visitor_id,
-        }
+        Returns one result dict per record, in order. Unlike `enroll`, a
+        record with no detectable face does not raise: its result has
+        success=False and the rest of the batch is still written.
+        """
+        now = datetime.now(timezone.utc)
+        results: List[Optional[Dict]] = [None] * len(records)
+        docs: List[Dict] = []
+        slots: List[int] = []
+
+        for i, (visitor_id, name, image, category) in enumerate(records):
+            try:
+                embedding = self._extract_embedding(image)
+            except ValueError as exc:
+                results[i] = {"success": False, "message": str(exc), "visitor_id": visitor_id}
+                continue
+            docs.append(self._build_doc(visitor_id, name, embedding, category, now))
+            slots.append(i)
+
+        for i, result in zip(slots, self._upsert(docs)):
+            results[i] = result
+        return results
 
     # ----------------------------------------------------------
     # Retrieval helpers
@@ -93,6 +136,7 @@ class EnrollmentManager:
     def delete_visitor(self, visitor_id: str) -> Dict:
         result = embeddings_col().delete_one({"visitor_id": visitor_id})
         if result.deleted_count:
+            self._count -= result.deleted_count
             return {"success": True, "message": f"Visitor {visitor_id} deleted."}
         return {"success": False, "message": "Visitor not found."}
 
@@ -100,12 +144,73 @@ class EnrollmentManager:
     # Internal helpers
     # ----------------------------------------------------------
 
-    @staticmethod
-    def _extract_embedding(image: np.ndarray) -> np.ndarray:
+    def _upsert(self, docs: List[Dict]) -> List[Dict]:
+        """Write visitor docs in one round-trip; one result dict per doc."""
+        if not docs:
+            return []
+
+        ops = [ReplaceOne({"visitor_id": doc["visitor_id"]}, doc, upsert=True) for doc in docs]
+        errors: Dict[int, str] = {}
+        try:
+            result = embeddings_col().bulk_write(ops, ordered=False)
+            upserted = result.upserted_count
+        except BulkWriteError as exc:
+            upserted = exc.details.get("nUpserted", 0)
+            errors = {
+                err["index"]: err.get("errmsg", "write failed")
+                for err in exc.details.get("writeErrors", [])
+            }
+        except PyMongoError as exc:
+            return [
+                {"success": False, "message": f"Database error: {exc}", "visitor_id": doc["visitor_id"]}
+                for doc in docs
+            ]
+
+        self._count += upserted
+
+        results = []
+        for i, doc in enumerate(docs):
+            if i in errors:
+                results.append({
+                    "success": False,
+                    "message": f"Database error: {errors[i]}",
+                    "visitor_id": doc["visitor_id"],
+                })
+            else:
+                results.append({
+                    "success": True,
+                    "message": f"Visitor '{doc['name']}' enrolled successfully.",
+                    "visitor_id": doc["visitor_id"],
+                })
+        return results
+
+    def _build_doc(
+        self,
+        visitor_id: str,
+        name: str,
+        embedding: np.ndarray,
+        category: str,
+        created_at: datetime,
+    ) -> Dict:
+        return {
+            "visitor_id": visitor_id,
+            "name": name,
+            "embedding": Binary(embedding.astype(EMBEDDING_DTYPE).tobytes()),
+            "embedding_dtype": EMBEDDING_DTYPE,
+            "embedding_dim": int(embedding.shape[0]),
+            "embedding_model": self.embedding_model,
+            "category": category,
+            "created_at": created_at,
+        }
+
+    def _extract_embedding(self, image: np.ndarray) -> np.ndarray:
         """
         Extract a normalised ArcFace embedding from a BGR numpy image.
-        Raises ValueError if DeepFace finds no face.
+        Raises ValueError if no face is found.
         """
+        if self._embedder is not None:
+            return self._embedder(image)
+
         try:
             results = DeepFace.represent(
                 img_path=image,
@@ -120,6 +225,4 @@ class EnrollmentManager:
         if not results:
             raise ValueError("DeepFace returned an empty result.")
 
-        vector = np.array(results[0]["embedding"], dtype=np.float32)
-        norm = np.linalg.norm(vector)
-        return vector / norm if norm > 0 else vector
+        return l2_normalise(results[0]["embedding"])
@@ -3,6 +3,13 @@ event_dispatcher.py - Forward events to an external backend via HTTP POST.
 
 Optional component: only used when BACKEND_WEBHOOK_URL is configured.
 Falls back gracefully to logging-only mode when no URL is set.
+
+Events are queued and a background task POSTs them in micro-batches over
+one long-lived connection pool, so a burst of alerts costs a handful of
+requests instead of one handshake-bound request per alert (multiplexed over
+HTTP/2 when the `h2` package is installed). The queue is bounded: if the
+backend falls behind, new events are dropped (and counted) rather than
+growing memory without limit.
 """
 
 from __future__ import annotations
@@ -10,21 +17,32 @@ from __future__ import annotations
 import asyncio
 import logging
 import os
-from typing import Dict
+from typing import Dict, List, Optional
 
 import httpx
 
+try:
+    import h2  # noqa: F401  (enables httpx's HTTP/2 support)
+except ImportError:  # optional, installed by httpx[http2]
+    h2 = None
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAX_QUEUE_SIZE = 1024
+
 
 class EventDispatcher:
     """
-    Non-blocking HTTP dispatcher with retry and backoff.
+    Non-blocking, batching HTTP dispatcher with retry and backoff.
+
+    The backend receives `{"events": [event, ...]}` per POST.
 
     Usage
     -----
     dispatcher = EventDispatcher()
+    dispatcher.start()                  # inside a running event loop
     await dispatcher.dispatch(event_dict)
+    await dispatcher.close()
     """
 
     def __init__(
@@ -33,29 +51,125 @@ class EventDispatcher:
         timeout_seconds: float = 2.0,
         max_retries: int = 2,
         retry_delay_seconds: float = 0.5,
+        batch_window_ms: float = 50.0,
+        max_batch_size: int = 64,
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
     ) -> None:
         self.backend_url = backend_url or os.getenv("BACKEND_WEBHOOK_URL", "")
         self.timeout = timeout_seconds
         self.max_retries = max_retries
         self.retry_delay = retry_delay_seconds
-        self._client = httpx.AsyncClient(timeout=timeout_seconds)
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        # Pool settings live on the transport: httpx ignores the client-level
+        # ones when a transport is given. Retries are ours (with backoff).
+        self._client = httpx.AsyncClient(
+            timeout=timeout_seconds,
+            transport=httpx.AsyncHTTPTransport(
+                http2=h2 is not None,
+                retries=0,
+                limits=httpx.Limits(
+                    max_connections=32,
+                    max_keepalive_connections=16,
+                    keepalive_expiry=60.0,
+                ),
+            ),
+        )
+        self.dropped_events = 0
+        self._queue: asyncio.Queue[Dict] = asyncio.Queue(maxsize=max(1, max_queue_size))
+        self._worker: Optional[asyncio.Task] = None
+        # Events the worker has taken off the queue but not yet delivered
+        self._batch: List[Dict] = []
+
+    def start(self) -> None:
+        """Start the background sender (no-op without a backend URL)."""
+        if not self.backend_url or self._worker is not None:
+            return
+        self._worker = asyncio.create_task(self._drain(), name="event-dispatcher")
 
     async def dispatch(self, event: Dict) -> bool:
         """
-        Send event to the configured backend URL.
+        Queue an event for delivery to the configured backend URL.
 
-        Returns True on success, False if all attempts fail.
-        If no URL is configured, logs the event and returns False.
+        Returns True if the event was queued.
+        If no URL is configured, or the queue is full, returns False.
         """
         if not self.backend_url:
             logger.debug("No backend URL configured. Event: %s", event)
             return False
 
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped_events += 1
+            logger.warning("Dispatch queue full; dropping event (%d dropped so far).",
+                           self.dropped_events)
+            return False
+        return True
+
+    async def close(self) -> None:
+        """Stop the sender, POST whatever is still queued, then close the pool."""
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        # The batch held by the cancelled worker first (its POST may have
+        # been cut off mid-flight, so the backend can see it twice)
+        if self._batch:
+            batch, self._batch = self._batch, []
+            await self._deliver(batch)
+
+        while not self._queue.empty():
+            batch = [
+                self._queue.get_nowait()
+                for _ in range(min(self.max_batch_size, self._queue.qsize()))
+            ]
+            await self._deliver(batch)
+
+        await self._client.aclose()
+
+    # ----------------------------------------------------------
+    # Internal helpers
+    # ----------------------------------------------------------
+
+    async def _drain(self) -> None:
+        """Collect events for up to `batch_window` and send them together."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self._batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._deliver(batch)
+            self._batch = []
+
+    async def _deliver(self, events: List[Dict]) -> None:
+        """`_send`, logging unexpected errors instead of raising them."""
+        try:
+            await self._send(events)
+        except Exception:
+            # e.g. an invalid URL or a payload that is not JSON-serialisable
+            logger.exception("Dispatch failed for %d event(s).", len(events))
+
+    async def _send(self, events: List[Dict]) -> bool:
+        """POST a batch of events. Returns True on success, False if all attempts fail."""
         for attempt in range(1, self.max_retries + 2):
             try:
                 response = await self._client.post(
                     self.backend_url,
-                    json=event,
+                    json={"events": events},
                 )
                 if response.is_success:
                     return True
@@ -69,8 +183,5 @@ class EventDispatcher:
             if attempt <= self.max_retries:
                 await asyncio.sleep(self.retry_delay)
 
-        logger.error("All dispatch attempts failed for event: %s", event.get("event_type"))
+        logger.error("All dispatch attempts failed for %d event(s).", len(events))
         return False
-
-    async def close(self) -> None:
-        await self._client.aclose()
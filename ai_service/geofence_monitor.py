@@ -2,14 +2,19 @@
 geofence_monitor.py - Geofence violation detection and tracking.
 
 Monitors visitor positions relative to predefined boundaries and triggers
-alerts when visitors spend too long outside authorized zones.
+alerts when visitors spend too long outside authorized zones. All faces of
+a frame can be checked together (`check_positions_bulk`), which runs one
+vectorised point-in-polygon test per camera instead of one per visitor.
+
+Violation alerts are written behind through an EventWriteBuffer
+(write_buffer.py) instead of one insert per alert.
 """
 
 from __future__ import annotations
 
 import json
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
@@ -18,6 +23,7 @@ import cv2
 import numpy as np
 
 from db import events_col
+from write_buffer import EventWriteBuffer
 
 logger = logging.getLogger(__name__)
 
@@ -28,20 +34,86 @@ logger = logging.getLogger(__name__)
 
 @dataclass
 class BoundaryConfig:
-    """Polygon boundary for a camera."""
+    """
+    Polygon boundary for a camera.
+
+    The contour, its axis-aligned bounding box and the polygon edges are
+    built once here, so `is_inside` rejects far-away points with four
+    comparisons and `contains_points` tests many points without rebuilding
+    anything. Points on an edge or vertex count as inside, as with
+    `cv2.pointPolygonTest(...) >= 0`. Treat `points` as immutable; create a
+    new config instead.
+    """
     camera_id: str
     points: List[Tuple[int, int]]  # [(x1,y1), (x2,y2), ...]
 
+    # Derived from `points` and excluded from __eq__ (arrays don't compare to
+    # a bool). _bbox is (xmin, ymin, xmax, ymax); _edges is (x0, y0, x1, y1,
+    # dx/dy) arrays.
+    _contour: np.ndarray = field(init=False, repr=False, compare=False)
+    _bbox: Tuple[int, int, int, int] = field(init=False, repr=False, compare=False)
+    _edges: Tuple[np.ndarray, ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self._contour = np.asarray(self.points, dtype=np.int32).reshape((-1, 1, 2))
+        self._contour.flags.writeable = False
+        vertices = self._contour[:, 0, :].astype(np.float64)
+        following = np.roll(vertices, -1, axis=0)
+        x0, y0 = vertices[:, 0], vertices[:, 1]
+        dx, dy = following[:, 0] - x0, following[:, 1] - y0
+        # Horizontal edges never straddle a scanline; their slope is unused
+        slope = np.divide(dx, dy, out=np.zeros_like(dx), where=dy != 0)
+        self._edges = (x0, y0, following[:, 0], following[:, 1], slope)
+        if len(self.points):
+            xs, ys = self._contour[:, 0, 0], self._contour[:, 0, 1]
+            self._bbox = (int(xs.min()), int(ys.min()), int(xs.max()), int(ys.max()))
+        else:
+            self._bbox = (0, 0, 0, 0)
+
+    @property
+    def contour(self) -> np.ndarray:
+        """Read-only (N, 1, 2) int32 polygon, as OpenCV drawing functions expect."""
+        return self._contour
+
     def is_inside(self, point: Tuple[int, int]) -> bool:
-        """Check if a point is inside the polygon boundary."""
+        """
+        Check if a point is inside the polygon boundary.
+
+        Points outside the bounding box are rejected without calling into
+        OpenCV; the rest go to cv2.pointPolygonTest on the cached contour.
+        Agrees with `contains_points`.
+        """
         if len(self.points) < 3:
             return True  # No boundary = all points valid
 
-        # Convert to numpy array for cv2
-        contour = np.array(self.points, dtype=np.int32).reshape((-1, 1, 2))
-        result = cv2.pointPolygonTest(contour, point, False)
+        x, y = point
+        xmin, ymin, xmax, ymax = self._bbox
+        if x < xmin or x > xmax or y < ymin or y > ymax:
+            return False
+
+        result = cv2.pointPolygonTest(self._contour, (float(x), float(y)), False)
         return result >= 0  # 1=inside, 0=on_edge, -1=outside
 
+    def contains_points(self, points: np.ndarray) -> np.ndarray:
+        """
+        Vectorised crossing-number test for an (N, 2) array of points.
+
+        Returns a boolean array of length N, matching `is_inside` per point.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(self.points) < 3:
+            return np.ones(len(points), dtype=bool)
+
+        px, py = points[:, 0:1], points[:, 1:2]  # (N, 1) against (E,) edges
+        x0, y0, x1, y1, slope = self._edges
+        on_edge = (
+            ((px - x0) * (y1 - y0) == (py - y0) * (x1 - x0))
+            & (px >= np.minimum(x0, x1)) & (px <= np.maximum(x0, x1))
+            & (py >= np.minimum(y0, y1)) & (py <= np.maximum(y0, y1))
+        )
+        crossings = ((y0 > py) != (y1 > py)) & (px < x0 + (py - y0) * slope)
+        return np.logical_xor.reduce(crossings, axis=1) | on_edge.any(axis=1)
+
 
 @dataclass
 class ViolationState:
@@ -62,12 +134,20 @@ class GeofenceMonitor:
     Monitor visitor positions against geofence boundaries.
 
     Triggers alerts when visitors remain outside boundaries for too long.
+
+    Usage
+    -----
+    monitor = GeofenceMonitor()
+    monitor.start()                 # inside a running event loop
+    monitor.check_position(...)     # alerts are persisted in the background
+    await monitor.stop()            # flushes whatever is still buffered
     """
 
     def __init__(
         self,
         violation_threshold_seconds: int = 60,
         duplicate_suppression_seconds: int = 30,
+        flush_interval_ms: float = 1000.0,
     ):
         self.violation_threshold = timedelta(seconds=violation_threshold_seconds)
         self.duplicate_window = timedelta(seconds=duplicate_suppression_seconds)
@@ -75,11 +155,25 @@ class GeofenceMonitor:
         # camera_id → BoundaryConfig
         self._boundaries: Dict[str, BoundaryConfig] = {}
 
-        # (camera_id, visitor_id) → ViolationState
-        self._violations: Dict[Tuple[str, str], ViolationState] = {}
+        # camera_id → visitor_id → ViolationState
+        self._violations: Dict[str, Dict[str, ViolationState]] = {}
+
+        # camera_id → visitor_id → last alert time
+        self._last_alert: Dict[str, Dict[str, datetime]] = {}
 
-        # (camera_id, visitor_id) → last alert time
-        self._last_alert: Dict[Tuple[str, str], datetime] = {}
+        self._writer = EventWriteBuffer("Geofence", flush_interval_ms)
+
+    # ----------------------------------------------------------
+    # Lifecycle
+    # ----------------------------------------------------------
+
+    def start(self) -> None:
+        """Start the background alert flusher."""
+        self._writer.start()
+
+    async def stop(self) -> None:
+        """Stop the flusher and write out any buffered alerts."""
+        await self._writer.stop()
 
     # ----------------------------------------------------------
     # Boundary management
@@ -170,9 +264,7 @@ class GeofenceMonitor:
         Optional[Dict]
             Alert document if violation threshold exceeded, else None.
         """
-        now = timestamp or datetime.now(timezone.utc)
-        if now.tzinfo is None:
-            now = now.replace(tzinfo=timezone.utc)
+        now = self._utc(timestamp)
 
         # Get boundary for this camera
         boundary = self._boundaries.get(camera_id)
@@ -180,24 +272,82 @@ class GeofenceMonitor:
             # No boundary defined = no geofence monitoring
             return None
 
-        key = (camera_id, visitor_id)
-        is_inside = boundary.is_inside(position)
+        return self._update(
+            boundary.is_inside(position),
+            visitor_id, name, camera_id, position, location, confidence, now,
+        )
+
+    def check_positions_bulk(self, visitor_updates: List[Dict]) -> List[Optional[Dict]]:
+        """
+        Check many visitors at once; the bulk form of `check_position`.
 
+        Parameters
+        ----------
+        visitor_updates : List[Dict]
+            One dict per visitor, keyed like the `check_position` arguments
+            (visitor_id, name, camera_id, position, location, confidence and
+            optionally timestamp).
+
+        Returns
+        -------
+        List[Optional[Dict]]
+            One entry per update, in order: an alert document or None.
+        """
+        results: List[Optional[Dict]] = [None] * len(visitor_updates)
+
+        by_camera: Dict[str, List[int]] = {}
+        for i, update in enumerate(visitor_updates):
+            if update["camera_id"] in self._boundaries:
+                by_camera.setdefault(update["camera_id"], []).append(i)
+
+        for camera_id, indices in by_camera.items():
+            positions = np.array(
+                [visitor_updates[i]["position"] for i in indices], dtype=np.float64,
+            )
+            inside = self._boundaries[camera_id].contains_points(positions)
+            for i, is_inside in zip(indices, inside.tolist()):
+                update = visitor_updates[i]
+                results[i] = self._update(
+                    is_inside,
+                    update["visitor_id"],
+                    update["name"],
+                    camera_id,
+                    update["position"],
+                    update["location"],
+                    update["confidence"],
+                    self._utc(update.get("timestamp")),
+                )
+        return results
+
+    def _update(
+        self,
+        is_inside: bool,
+        visitor_id: str,
+        name: str,
+        camera_id: str,
+        position: Tuple[int, int],
+        location: str,
+        confidence: float,
+        now: datetime,
+    ) -> Optional[Dict]:
+        """Advance one visitor's violation state; return an alert if due."""
         if is_inside:
             # Visitor is inside boundary → clear violation state
-            if key in self._violations:
+            violations = self._violations.get(camera_id)
+            if violations and violations.pop(visitor_id, None) is not None:
                 logger.debug(
                     "Visitor %s returned inside boundary (camera=%s)",
                     visitor_id,
                     camera_id,
                 )
-                del self._violations[key]
             return None
 
         # Visitor is OUTSIDE boundary
-        if key not in self._violations:
+        violations = self._violations.setdefault(camera_id, {})
+        state = violations.get(visitor_id)
+        if state is None:
             # Start tracking violation
-            self._violations[key] = ViolationState(
+            state = violations[visitor_id] = ViolationState(
                 visitor_id=visitor_id,
                 name=name,
                 started_at=now,
@@ -211,12 +361,10 @@ class GeofenceMonitor:
             )
         else:
             # Update existing violation
-            state = self._violations[key]
             state.last_seen_at = now
             state.position = position
 
         # Check if violation duration exceeds threshold
-        state = self._violations[key]
         duration = now - state.started_at
 
         if duration >= self.violation_threshold:
@@ -255,6 +403,13 @@ class GeofenceMonitor:
     # Internal helpers
     # ----------------------------------------------------------
 
+    @staticmethod
+    def _utc(timestamp: Optional[datetime]) -> datetime:
+        now = timestamp or datetime.now(timezone.utc)
+        if now.tzinfo is None:
+            now = now.replace(tzinfo=timezone.utc)
+        return now
+
     def _should_emit_alert(
         self,
         camera_id: str,
@@ -262,11 +417,11 @@ class GeofenceMonitor:
         now: datetime,
     ) -> bool:
         """Check if we should emit alert (duplicate suppression)."""
-        key = (camera_id, visitor_id)
-        last = self._last_alert.get(key)
+        last_alert = self._last_alert.setdefault(camera_id, {})
+        last = last_alert.get(visitor_id)
         if last and (now - last) < self.duplicate_window:
             return False
-        self._last_alert[key] = now
+        last_alert[visitor_id] = now
         return True
 
     def _create_alert(
@@ -280,7 +435,7 @@ class GeofenceMonitor:
         duration_seconds: int,
         timestamp: datetime,
     ) -> Dict:
-        """Create and persist a geofence violation alert."""
+        """Create a geofence violation alert and buffer it for persistence."""
         doc = {
             "visitor_id": visitor_id,
             "name": name,
@@ -294,20 +449,15 @@ class GeofenceMonitor:
             "duration_seconds": duration_seconds,
         }
 
-        try:
-            events_col().insert_one(doc)
-        except Exception as exc:
-            logger.warning("Failed to insert geofence alert: %s", exc)
+        self._writer.append(doc)
 
-        doc.pop("_id", None)
-        doc["timestamp"] = timestamp.isoformat()
         logger.warning(
             "🚨 GEOFENCE VIOLATION: visitor=%s camera=%s duration=%ds",
             visitor_id,
             camera_id,
             duration_seconds,
         )
-        return doc
+        return {**doc, "timestamp": timestamp.isoformat()}
 
     # ----------------------------------------------------------
     # Visualization helpers
@@ -320,7 +470,7 @@ class GeofenceMonitor:
             return frame
 
         # Draw polygon outline
-        pts = np.array(boundary.points, np.int32).reshape((-1, 1, 2))
+        pts = boundary.contour
         cv2.polylines(frame, [pts], isClosed=True, color=(0, 255, 0), thickness=2)
 
         # Draw filled polygon with transparency
@@ -336,12 +486,14 @@ class GeofenceMonitor:
         camera_id: str,
     ) -> np.ndarray:
         """Draw violation indicators for visitors outside boundary."""
-        for (cam_id, visitor_id), state in self._violations.items():
-            if cam_id != camera_id:
-                continue
+        violations = self._violations.get(camera_id)
+        if not violations:
+            return frame
 
+        now = datetime.now(timezone.utc)
+        for visitor_id, state in violations.items():
             x, y = state.position
-            duration = (datetime.now(timezone.utc) - state.started_at).total_seconds()
+            duration = (now - state.started_at).total_seconds()
 
             # Draw red circle at visitor position
             cv2.circle(frame, (x, y), 10, (0, 0, 255), -1)
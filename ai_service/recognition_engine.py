@@ -3,6 +3,26 @@ recognition_engine.py - Real-time face detection and identification.
 
 Loads ArcFace embeddings from MongoDB and performs cosine-distance matching
 against each detected face in a video frame.
+
+The enrolled gallery is kept as one contiguous (N, D) float32 matrix of unit
+rows, so cosine similarity for all faces in a frame is a single `Q @ G.T`
+BLAS call. Optionally the gallery is quantised to int8 (4x smaller) and
+matched with simsimd's int8 cosine kernels.
+
+Large frames are detected on a copy downscaled to `max_side`. Faces that
+end up smaller than the embedder input there are detected again on a
+full-resolution crop around them, so they are embedded from the original
+pixels rather than an upsampled thumbnail.
+
+Embeddings come from DeepFace's ArcFace model by default: the model client
+is built once (see `warmup`) and called directly on the detector's aligned
+faces, preprocessed here, bypassing the per-call `DeepFace.represent`
+wrapper. All faces of a batch go through a single forward pass. When an
+ArcFace ONNX export is configured, they are computed with ONNX Runtime
+instead, on the CUDA execution provider when available (fp16 models are
+supported as-is). The two embedders produce different embedding spaces,
+so enrollment embeds through `embed_face` and the gallery only loads
+records tagged with the active `embedding_model`.
 """
 
 from __future__ import annotations
@@ -10,13 +30,26 @@ from __future__ import annotations
 import logging
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from threading import Lock
+from pathlib import Path
+from threading import Lock, local
 from typing import Dict, List, Optional, Tuple
 
+import cv2
 import numpy as np
 from deepface import DeepFace
 
 from db import embeddings_col
+from embedding_utils import l2_normalise, l2_normalise_rows
+
+try:
+    import simsimd
+except ImportError:  # optional accelerator
+    simsimd = None
+
+try:
+    import onnxruntime as ort
+except ImportError:  # optional accelerator
+    ort = None
 
 logger = logging.getLogger(__name__)
 
@@ -27,12 +60,38 @@ logger = logging.getLogger(__name__)
 MODEL_NAME = "ArcFace"
 DETECTOR_BACKEND = "retinaface"
 DEFAULT_DISTANCE_THRESHOLD = 0.40   # L2 on unit vectors; tune as needed
+ONNX_INPUT_SIZE = (112, 112)        # ArcFace input (w, h)
+ONNX_PROVIDERS = ("CUDAExecutionProvider", "CPUExecutionProvider")
+MIN_BATCH_CAPACITY = 8              # face slots in the reusable input buffer
+REFINE_FACE_SIDE = 112              # smaller faces in a downscaled frame are re-cropped
+
+# Fields `_parse_record` reads; skips created_at and anything added later
+_RECORD_PROJECTION = {
+    "_id": 0, "visitor_id": 1, "name": 1, "category": 1,
+    "embedding": 1, "embedding_dtype": 1, "embedding_model": 1,
+}
 
 
 # ──────────────────────────────────────────────────────────
 # Data structures
 # ──────────────────────────────────────────────────────────
 
+@dataclass(frozen=True)
+class _Gallery:
+    """
+    Enrolled faces as parallel columns: row i of `matrix` belongs to
+    ids[i] / names[i] / categories[i]. `matrix` holds unit rows (float32,
+    or int8 when quantised).
+    """
+    ids: List[str]
+    names: List[str]
+    categories: List[str]
+    matrix: np.ndarray
+
+
+_EMPTY_GALLERY = _Gallery([], [], [], np.empty((0, 0), dtype=np.float32))
+
+
 @dataclass
 class FaceMatch:
     """All information returned for a single detected face."""
@@ -44,6 +103,41 @@ class FaceMatch:
     embedding: np.ndarray = field(repr=False, compare=False)
 
 
+# ──────────────────────────────────────────────────────────
+# Preprocessing
+# ──────────────────────────────────────────────────────────
+
+def preprocess(frame: np.ndarray, max_side: int) -> Tuple[np.ndarray, float]:
+    """
+    Downscale `frame` so that its longer side is at most `max_side` pixels.
+
+    Returns (frame, scale). Coordinates in the returned frame map back to
+    the source frame by dividing by `scale` (1.0 when no resize happened,
+    or when `max_side` <= 0).
+    """
+    longest = max(frame.shape[:2])
+    if max_side <= 0 or longest <= max_side:
+        return frame, 1.0
+    scale = max_side / longest
+    resized = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return resized, scale
+
+
+def frame_dhash(frame: np.ndarray) -> int:
+    """
+    64-bit difference hash of a BGR frame.
+
+    Each bit is the sign of a horizontal gradient on a 9x8 grayscale
+    thumbnail, so the hash ignores sensor noise and small lighting drift
+    but changes when something in the scene moves. Compare two hashes by
+    the popcount of their XOR.
+    """
+    thumb = cv2.cvtColor(cv2.resize(frame, (9, 8), interpolation=cv2.INTER_AREA),
+                         cv2.COLOR_BGR2GRAY)
+    bits = thumb[:, 1:] > thumb[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
 # ──────────────────────────────────────────────────────────
 # Engine
 # ──────────────────────────────────────────────────────────
@@ -55,9 +149,11 @@ class RecognitionEngine:
     Typical usage
     -------------
     engine = RecognitionEngine()
-    engine.load_embeddings()          # call once at startup
-    matches = engine.identify(frame)  # call per frame
-    engine.load_embeddings()          # call again to refresh after new enrolments
+    engine.warmup()                            # build models once at startup
+    engine.load_embeddings()                   # call once at startup
+    matches = engine.identify(frame)           # call per frame
+    results = engine.identify_batch([f1, f2])  # or many frames at once
+    engine.load_embeddings()                   # call again to refresh after new enrolments
     """
 
     def __init__(
@@ -65,12 +161,41 @@ class RecognitionEngine:
         distance_threshold: float = DEFAULT_DISTANCE_THRESHOLD,
         model_name: str = MODEL_NAME,
         detector_backend: str = DETECTOR_BACKEND,
+        quantize: bool = False,
+        onnx_model_path: str = "",
+        force_cpu: bool = False,
+        max_side: int = 0,
     ) -> None:
         self.distance_threshold = distance_threshold
         self.model_name = model_name
         self.detector_backend = detector_backend
-
-        self._cache: List[Dict] = []
+        # Longest side frames are detected at (0 = full size)
+        self.max_side = max_side
+
+        # int8 matching needs simsimd's i8 kernels; NumPy has no int8 GEMM
+        self.quantize = quantize and simsimd is not None
+        if quantize and simsimd is None:
+            logger.warning("simsimd not installed; keeping float32 gallery.")
+
+        self._session = (
+            self._load_onnx(onnx_model_path, force_cpu) if onnx_model_path else None
+        )
+        # Tag of the embedding space; enrolled records must carry the same one
+        # (records without a tag predate it and were embedded with DeepFace)
+        self.embedding_model = (
+            f"onnx:{Path(onnx_model_path).name}" if self._session is not None else model_name
+        )
+
+        # DeepFace FacialRecognition client, built once by `warmup` (or lazily)
+        self._embedder = None
+
+        # Per-thread (N, rows, cols, 3) float32 model input, reused per batch
+        self._buffers = local()
+
+        # Never mutated: writers build a new _Gallery and publish it with
+        # one attribute store, so readers need no lock
+        self._snapshot = _EMPTY_GALLERY
+        # Serialises writers (full reloads vs single-visitor refreshes)
         self._lock = Lock()
 
     # ----------------------------------------------------------
@@ -81,35 +206,88 @@ class RecognitionEngine:
         """
         Pull all embeddings from MongoDB into memory.
         Returns the number of records loaded.
+
+        The cursor is streamed straight into a gallery matrix preallocated
+        from the document count, so no list of documents or per-row arrays
+        is held alongside it.
         """
-        records = list(embeddings_col().find({}, {"_id": 0}))
-        cache: List[Dict] = []
+        # Read, build and publish in one critical section: a concurrent
+        # refresh_visitor lands before or after the reload, never inside it
+        with self._lock:
+            snapshot = self._snapshot = self._read_gallery()
 
-        for rec in records:
-            raw = rec.get("embedding")
-            if not raw:
-                continue
-            vector = np.array(raw, dtype=np.float32)
-            norm = np.linalg.norm(vector)
-            if norm == 0:
-                continue
-            cache.append({
-                "visitor_id": rec.get("visitor_id", "unknown"),
-                "name": rec.get("name", "Unknown"),
-                "category": rec.get("category", "unknown"),
-                "embedding": vector / norm,
-            })
+        logger.info("Loaded %d face embeddings from database.", len(snapshot.ids))
+        return len(snapshot.ids)
 
-        with self._lock:
-            self._cache = cache
+    def refresh_visitor(self, visitor_id: str) -> bool:
+        """
+        Re-sync a single visitor's gallery row from MongoDB.
 
-        logger.info("Loaded %d face embeddings from database.", len(cache))
-        return len(cache)
+        Adds, replaces or removes just that row, so enrolments and deletions
+        don't trigger a full `load_embeddings()`. Returns True if the visitor
+        is in the gallery afterwards.
+        """
+        with self._lock:
+            rec = embeddings_col().find_one({"visitor_id": visitor_id}, _RECORD_PROJECTION)
+            if rec and self._from_other_model(rec):
+                logger.warning("Visitor %s was enrolled with %s, not %s; re-enroll to match.",
+                               visitor_id, rec.get("embedding_model", MODEL_NAME),
+                               self.embedding_model)
+                rec = None
+            parsed = self._parse_record(rec) if rec else None
+
+            current = self._snapshot
+            ids = list(current.ids)
+            names = list(current.names)
+            categories = list(current.categories)
+            gallery = current.matrix
+            try:
+                idx: Optional[int] = ids.index(visitor_id)
+            except ValueError:
+                idx = None
+
+            if parsed is None:
+                if idx is not None:
+                    del ids[idx], names[idx], categories[idx]
+                    gallery = np.delete(gallery, idx, axis=0)
+            else:
+                (_, name, category), vector = parsed
+                row = l2_normalise(vector)[None, :]
+                if self.quantize:
+                    row = self._quantize(row)
+                if idx is not None:
+                    names[idx], categories[idx] = name, category
+                    gallery = gallery.copy()
+                    gallery[idx] = row[0]
+                else:
+                    ids.append(visitor_id)
+                    names.append(name)
+                    categories.append(category)
+                    gallery = np.vstack([gallery, row]) if current.ids else row
+
+            # Publish new objects; readers may still hold the old ones
+            self._snapshot = _Gallery(ids, names, categories, np.ascontiguousarray(gallery))
+
+        return parsed is not None
 
     # ----------------------------------------------------------
     # Identification
     # ----------------------------------------------------------
 
+    def warmup(self) -> None:
+        """
+        Load detector and embedder weights now rather than on the first frame.
+
+        Runs one detection on a blank image (DeepFace caches the detector
+        after first use) and builds the ArcFace client the embedder calls.
+        """
+        if self._session is None:
+            self._deepface_model()
+        self._detect(np.zeros((160, 160, 3), dtype=np.uint8))
+        logger.info("Recognition models loaded (%s + %s).",
+                    self.detector_backend,
+                    "ONNX" if self._session is not None else self.model_name)
+
     def identify(self, frame: np.ndarray) -> List[FaceMatch]:
         """
         Detect all faces in `frame` and return identification results.
@@ -124,6 +302,87 @@ class RecognitionEngine:
         List[FaceMatch]
             One entry per detected face.
         """
+        return self.identify_batch([frame])[0]
+
+    def identify_batch(self, frames: List[np.ndarray]) -> List[List[FaceMatch]]:
+        """
+        Identify faces in several frames with a single call.
+
+        Faces from every frame are detected first, then embedded and matched
+        against the gallery together, so per-call overhead is paid once per
+        batch rather than once per face. Frames may come from different
+        cameras and therefore have different resolutions, so they are
+        passed as a list rather than a stacked array.
+
+        Returns
+        -------
+        List[List[FaceMatch]]
+            One list of matches per input frame, in the same order, with
+            bounding boxes in that frame's own pixels.
+        """
+        owners: List[int] = []
+        boxes: List[Dict[str, int]] = []
+        faces: List[np.ndarray] = []
+
+        for i, frame in enumerate(frames):
+            for box, face in self._detect_scaled(frame):
+                owners.append(i)
+                boxes.append(box)
+                faces.append(face)
+
+        results: List[List[FaceMatch]] = [[] for _ in frames]
+        if not faces:
+            return results
+
+        embeddings = self._embed_batch(faces)
+        keep = [k for k, emb in enumerate(embeddings) if emb is not None]
+        if not keep:
+            return results
+
+        probes = np.stack([embeddings[k] for k in keep])
+        for k, embedding, (visitor_id, name, category, conf) in zip(
+            keep, probes, self._match(probes)
+        ):
+            results[owners[k]].append(FaceMatch(
+                visitor_id=visitor_id,
+                name=name,
+                category=category,
+                confidence=conf,
+                bounding_box=boxes[k],
+                embedding=embedding,
+            ))
+
+        return results
+
+    def embed_face(self, image: np.ndarray) -> np.ndarray:
+        """
+        Normalised embedding of the largest face in a BGR image.
+
+        Uses the same detector and embedder as `identify`, so enrolled
+        vectors land in the space probes are matched in. Raises ValueError
+        if no face is detected or the embedding fails.
+        """
+        detections = self._detect_scaled(image)
+        if not detections:
+            raise ValueError("Face not detected in image.")
+        _, face = max(detections, key=lambda d: d[0]["w"] * d[0]["h"])
+        embedding = self._embed_batch([face])[0]
+        if embedding is None:
+            raise ValueError("Embedding extraction failed.")
+        return embedding
+
+    # ----------------------------------------------------------
+    # Internal helpers
+    # ----------------------------------------------------------
+
+    def _detect(self, frame: np.ndarray) -> List[Tuple[Dict[str, int], np.ndarray]]:
+        """
+        Run the face detector and return (bounding_box, face) pairs.
+
+        `face` is the detector's own eye-aligned crop (RGB, float in [0, 1]),
+        i.e. the same input enrollment embeds via `DeepFace.represent`; it
+        is used as-is instead of re-slicing the unaligned box from `frame`.
+        """
         try:
             detections = DeepFace.extract_faces(
                 img_path=frame,
@@ -135,7 +394,7 @@ class RecognitionEngine:
             logger.warning("Face detection failed: %s", exc)
             return []
 
-        matches: List[FaceMatch] = []
+        faces: List[Tuple[Dict[str, int], np.ndarray]] = []
 
         for det in detections:
             confidence_score = det.get("confidence", 0)
@@ -150,72 +409,303 @@ class RecognitionEngine:
             if w <= 0 or h <= 0:
                 continue
 
-            crop = frame[y: y + h, x: x + w]
-            if crop.size == 0:
+            face = det.get("face")
+            if face is None or face.size == 0:
                 continue
 
-            embedding = self._embed(crop)
-            if embedding is None:
-                continue
+            faces.append(({"x": x, "y": y, "w": w, "h": h},
+                          np.asarray(face, dtype=np.float32)))
 
-            visitor_id, name, category, conf = self._match(embedding)
+        return faces
 
-            matches.append(FaceMatch(
-                visitor_id=visitor_id,
-                name=name,
-                category=category,
-                confidence=conf,
-                bounding_box={"x": x, "y": y, "w": w, "h": h},
-                embedding=embedding,
-            ))
+    def _detect_scaled(self, frame: np.ndarray) -> List[Tuple[Dict[str, int], np.ndarray]]:
+        """
+        `_detect` on `frame` downscaled to `max_side`, boxes in `frame` pixels.
 
-        return matches
+        A face smaller than REFINE_FACE_SIDE in the downscaled copy is
+        detected again on a full-resolution crop around it (see `_refine`),
+        so its aligned crop keeps the original detail.
+        """
+        small, scale = preprocess(frame, self.max_side)
+        if scale == 1.0:
+            return self._detect(frame)
+
+        faces: List[Tuple[Dict[str, int], np.ndarray]] = []
+        for box, face in self._detect(small):
+            full_box = {k: int(v / scale) for k, v in box.items()}
+            if min(box["w"], box["h"]) < REFINE_FACE_SIDE:
+                full_box, face = self._refine(frame, full_box) or (full_box, face)
+            faces.append((full_box, face))
+        return faces
+
+    def _refine(
+        self, frame: np.ndarray, box: Dict[str, int],
+    ) -> Optional[Tuple[Dict[str, int], np.ndarray]]:
+        """
+        Re-detect the face at `box` on a full-resolution crop of `frame`.
 
-    # ----------------------------------------------------------
-    # Internal helpers
-    # ----------------------------------------------------------
+        The crop keeps half a face of margin on each side for the detector.
+        Returns the detection nearest the crop's centre (box in `frame`
+        pixels), or None if the detector finds nothing there.
+        """
+        x, y, w, h = box["x"], box["y"], box["w"], box["h"]
+        x0, y0 = max(0, x - w // 2), max(0, y - h // 2)
+        x1 = min(frame.shape[1], x + w + w // 2)
+        y1 = min(frame.shape[0], y + h + h // 2)
+        crop, scale = preprocess(np.ascontiguousarray(frame[y0:y1, x0:x1]), self.max_side)
+
+        cx, cy = (x + w / 2 - x0) * scale, (y + h / 2 - y0) * scale
+        best = min(
+            self._detect(crop),
+            key=lambda d: (d[0]["x"] + d[0]["w"] / 2 - cx) ** 2
+            + (d[0]["y"] + d[0]["h"] / 2 - cy) ** 2,
+            default=None,
+        )
+        if best is None:
+            return None
+        found, face = best
+        return {
+            "x": x0 + int(found["x"] / scale),
+            "y": y0 + int(found["y"] / scale),
+            "w": int(found["w"] / scale),
+            "h": int(found["h"] / scale),
+        }, face
+
+    def _read_gallery(self) -> _Gallery:
+        """Stream every stored embedding into a new gallery (call under `_lock`)."""
+        col = embeddings_col()
+        expected = col.count_documents({})
+        ids: List[str] = []
+        names: List[str] = []
+        categories: List[str] = []
+        gallery: Optional[np.ndarray] = None
+        foreign = 0
+
+        for rec in col.find({}, _RECORD_PROJECTION):
+            if self._from_other_model(rec):
+                foreign += 1
+                continue
+            parsed = self._parse_record(rec)
+            if parsed is None:
+                continue
+            (visitor_id, name, category), vector = parsed
+            if gallery is None:
+                gallery = np.empty((max(expected, 1), vector.shape[0]), dtype=np.float32)
+            elif vector.shape[0] != gallery.shape[1]:
+                logger.warning("Skipping %s: %d-dim embedding, gallery is %d-dim.",
+                               visitor_id, vector.shape[0], gallery.shape[1])
+                continue
+            elif len(ids) == len(gallery):
+                # Enrolled after count_documents(); grow rather than fail
+                gallery = np.concatenate([gallery, np.empty_like(gallery)])
+            gallery[len(ids)] = vector
+            ids.append(visitor_id)
+            names.append(name)
+            categories.append(category)
+
+        if foreign:
+            logger.warning("Skipped %d embedding(s) enrolled with another model; "
+                           "re-enroll them to match with %s.", foreign, self.embedding_model)
+
+        if gallery is None:
+            gallery = np.empty((0, 0), dtype=np.float32)
+        else:
+            # Normalise in place so matching is a pure dot product
+            gallery = gallery[:len(ids)]
+            gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+
+        if self.quantize:
+            gallery = self._quantize(gallery)
+        return _Gallery(ids, names, categories, gallery)
+
+    def _from_other_model(self, rec: Dict) -> bool:
+        """True if `rec` was embedded by a different model than the active one."""
+        return rec.get("embedding_model", MODEL_NAME) != self.embedding_model
+
+    @staticmethod
+    def _parse_record(rec: Dict) -> Optional[Tuple[Tuple[str, str, str], np.ndarray]]:
+        """Turn an embeddings document into ((visitor_id, name, category), raw vector)."""
+        raw = rec.get("embedding")
+        if not raw:
+            return None
+        if isinstance(raw, bytes):
+            # Packed binary (bson Binary is a bytes subclass)
+            dtype = rec.get("embedding_dtype", "float16")
+            vector = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+        else:
+            # Legacy documents store a list of floats
+            vector = np.array(raw, dtype=np.float32)
+        if not vector.any():
+            return None
+        meta = (
+            rec.get("visitor_id", "unknown"),
+            rec.get("name", "Unknown"),
+            rec.get("category", "unknown"),
+        )
+        return meta, vector
+
+    @staticmethod
+    def _load_onnx(path: str, force_cpu: bool = False):
+        """Create an ONNX Runtime session, preferring CUDA unless `force_cpu`."""
+        if ort is None:
+            logger.warning("onnxruntime not installed; using DeepFace embedder.")
+            return None
+        available = ort.get_available_providers()
+        wanted = ("CPUExecutionProvider",) if force_cpu else ONNX_PROVIDERS
+        providers = [p for p in wanted if p in available]
+        try:
+            session = ort.InferenceSession(path, providers=providers)
+        except Exception as exc:
+            logger.error("Failed to load ONNX embedder %s: %s", path, exc)
+            return None
+        logger.info("ONNX embedder loaded from %s (providers=%s).",
+                    path, session.get_providers())
+        return session
+
+    def _embed_onnx(self, faces: List[np.ndarray]) -> np.ndarray:
+        """Run the ONNX ArcFace model once on a batch of RGB [0, 1] faces → (K, D)."""
+        inp = self._session.get_inputs()[0]
+        dtype = np.float16 if inp.type == "tensor(float16)" else np.float32
+
+        rgb = self._input_buffer(len(faces), ONNX_INPUT_SIZE[1], ONNX_INPUT_SIZE[0])
+        for face, slot in zip(faces, rgb):
+            cv2.resize(face, ONNX_INPUT_SIZE, dst=slot)
+        # (x*255 - 127.5) / 127.5 on [0, 1] input
+        rgb *= 2.0
+        rgb -= 1.0
+        blob = np.ascontiguousarray(rgb.transpose(0, 3, 1, 2), dtype=dtype)
+
+        output = self._session.run(None, {inp.name: blob})[0]
+        return np.asarray(output, dtype=np.float32)
+
+    def _embed_deepface(self, faces: List[np.ndarray]) -> np.ndarray:
+        """Run DeepFace's ArcFace once on a batch of aligned RGB faces → (K, D)."""
+        model = self._deepface_model()
+        # input_shape is (w, h); rows come first in the batch buffer.
+        # DeepFace.represent feeds detected faces as BGR; do the same so
+        # probes land in the same space as enrolled embeddings.
+        blob = self._input_buffer(len(faces), model.input_shape[1], model.input_shape[0])
+        for face, slot in zip(faces, blob):
+            self._letterbox(face, slot, bgr=True)
+        # model.forward() only returns row 0; call the Keras model directly
+        output = model.model(blob, training=False).numpy()
+        return np.asarray(output, dtype=np.float32)
+
+    def _embed_batch(self, faces: List[np.ndarray]) -> List[Optional[np.ndarray]]:
+        """Normalised embeddings for each face (None where extraction failed)."""
+        if self._session is not None:
+            try:
+                vectors = self._embed_onnx(faces)
+            except Exception as exc:
+                logger.debug("ONNX embedding failed: %s", exc)
+                return [None] * len(faces)
+            return list(l2_normalise_rows(vectors))
 
-    def _embed(self, face_crop: np.ndarray) -> Optional[np.ndarray]:
-        """Generate a normalised embedding for a face crop."""
         try:
-            result = DeepFace.represent(
-                img_path=face_crop,
-                model_name=self.model_name,
-                detector_backend="skip",      # face already cropped
-                enforce_detection=False,
-                align=False,
-            )
-            vector = np.array(result[0]["embedding"], dtype=np.float32)
-            norm = np.linalg.norm(vector)
-            return vector / norm if norm > 0 else vector
+            vectors = self._embed_deepface(faces)
+        except Exception as exc:
+            # Retry one by one so a single bad face doesn't sink the batch
+            logger.debug("Batched embedding failed: %s", exc)
+            return [self._embed(face) for face in faces]
+        return list(l2_normalise_rows(vectors))
+
+    def _embed(self, face: np.ndarray) -> Optional[np.ndarray]:
+        """Generate a normalised embedding for an aligned RGB face."""
+        try:
+            return l2_normalise(self._embed_deepface([face])[0])
         except Exception as exc:
             logger.debug("Embedding extraction failed: %s", exc)
             return None
 
-    def _match(self, probe: np.ndarray) -> Tuple[str, str, str, float]:
+    def _deepface_model(self):
+        if self._embedder is None:
+            self._embedder = DeepFace.build_model(self.model_name)
+        return self._embedder
+
+    def _input_buffer(self, count: int, rows: int, cols: int) -> np.ndarray:
         """
-        Find the closest entry in the cache.
+        Contiguous (count, rows, cols, 3) float32 batch for the embedder.
 
-        Returns (visitor_id, name, category, confidence).
+        Reused across calls (grown to the next power of two when a frame
+        has more faces), so preprocessing writes every face straight into
+        the model input instead of stacking per-face temporaries. One per
+        thread, since the engine may be called from several.
         """
-        with self._lock:
-            candidates = list(self._cache)
-
-        if not candidates:
-            return "unknown", "Unknown", "unknown", 0.0
-
-        distances = np.array([
-            np.linalg.norm(probe - c["embedding"])
-            for c in candidates
-        ])
-        idx = int(np.argmin(distances))
-        best_dist = float(distances[idx])
-
-        if best_dist > self.distance_threshold:
-            # Normalise distance to a rough confidence score
-            conf = float(max(0.0, 1.0 - best_dist))
-            return "unknown", "Unknown", "unknown", conf
-
-        conf = float(max(0.0, 1.0 - (best_dist / self.distance_threshold)))
-        best = candidates[idx]
-        return best["visitor_id"], best["name"], best["category"], conf
+        buf = getattr(self._buffers, "batch", None)
+        if buf is None or buf.shape[0] < count or buf.shape[1:3] != (rows, cols):
+            capacity = max(MIN_BATCH_CAPACITY, 1 << (count - 1).bit_length())
+            buf = self._buffers.batch = np.empty((capacity, rows, cols, 3), dtype=np.float32)
+        return buf[:count]
+
+    @staticmethod
+    def _letterbox(face: np.ndarray, out: np.ndarray, bgr: bool = False) -> np.ndarray:
+        """
+        Fit `face` into the float32 model input `out` (rows, cols, 3) in [0, 1].
+
+        Same as DeepFace's "base" preprocessing: aspect-preserving resize,
+        centred on black padding. Channels are reversed when `bgr` is set.
+        """
+        rows, cols = out.shape[:2]
+        factor = min(rows / face.shape[0], cols / face.shape[1])
+        h = max(1, int(face.shape[0] * factor))
+        w = max(1, int(face.shape[1] * factor))
+        resized = cv2.resize(face, (w, h))
+        if resized.max() > 1:
+            resized = resized / np.float32(255.0)
+
+        out.fill(0.0)
+        top, left = (rows - h) // 2, (cols - w) // 2
+        out[top:top + h, left:left + w] = resized[..., ::-1] if bgr else resized
+        return out
+
+    def _match(self, probes: np.ndarray) -> List[Tuple[str, str, str, float]]:
+        """
+        Find the closest gallery entry for each row of `probes` (M, D).
+
+        Returns one (visitor_id, name, category, confidence) per probe.
+        """
+        snapshot = self._snapshot
+        if not snapshot.ids:
+            return [("unknown", "Unknown", "unknown", 0.0)] * len(probes)
+
+        # (M, N) cosine distances; rows are unit vectors, so the L2
+        # distance the threshold is defined on is sqrt(2 * cosine).
+        cosine = self._cosine_distances(probes, snapshot.matrix)
+        idx = np.argmin(cosine, axis=1)
+        best = np.sqrt(np.maximum(0.0, 2.0 * cosine[np.arange(len(idx)), idx]))
+
+        results: List[Tuple[str, str, str, float]] = []
+        for i, best_dist in zip(idx.tolist(), best.tolist()):
+            if best_dist > self.distance_threshold:
+                # Normalise distance to a rough confidence score
+                conf = float(max(0.0, 1.0 - best_dist))
+                results.append(("unknown", "Unknown", "unknown", conf))
+                continue
+
+            conf = float(max(0.0, 1.0 - (best_dist / self.distance_threshold)))
+            results.append((snapshot.ids[i], snapshot.names[i], snapshot.categories[i], conf))
+        return results
+
+    @staticmethod
+    def _quantize(vectors: np.ndarray) -> np.ndarray:
+        """
+        Map float vectors onto int8 with a per-row scale (max |v| → 127).
+
+        Unit-length 512-d embeddings rarely have components above ~0.2, so
+        a fixed ±1 → ±127 mapping would use only a few dozen levels. The
+        scales need not be stored: cosine distance ignores row magnitude.
+        """
+        vectors = np.atleast_2d(vectors)
+        peak = np.abs(vectors).max(axis=1, keepdims=True)
+        scale = np.divide(127.0, peak, out=np.zeros_like(peak), where=peak > 0)
+        return np.round(vectors * scale).astype(np.int8)
+
+    @classmethod
+    def _cosine_distances(cls, probes: np.ndarray, gallery: np.ndarray) -> np.ndarray:
+        """(M, D) x (N, D) -> (M, N) cosine distances."""
+        if gallery.dtype == np.int8:
+            return np.asarray(simsimd.cdist(cls._quantize(probes), gallery, metric="cosine"))
+
+        # Both sides are unit rows: cosine similarity is one SGEMM, no norms
+        probes = np.ascontiguousarray(probes, dtype=np.float32)
+        return 1.0 - probes @ gallery.T
@@ -0,0 +1,81 @@
+"""Tests for batch_scheduler.BatchScheduler."""
+
+import asyncio
+import threading
+
+from batch_scheduler import BatchScheduler
+
+
+def _echo_batches(calls):
+    """Batch function that records batch sizes and echoes each frame back."""
+    def batch_fn(frames):
+        calls.append(len(frames))
+        return [[frame] for frame in frames]
+    return batch_fn
+
+
+def test_concurrent_frames_are_collected_into_one_batch():
+    calls = []
+
+    async def run():
+        scheduler = BatchScheduler(_echo_batches(calls), max_batch_size=8, max_wait_ms=50)
+        scheduler.start()
+        results = await asyncio.gather(*(scheduler.submit(i) for i in range(3)))
+        await scheduler.stop()
+        return results
+
+    assert asyncio.run(run()) == [[0], [1], [2]]
+    assert calls == [3]
+
+
+def test_batches_are_capped_at_max_batch_size():
+    calls = []
+
+    async def run():
+        scheduler = BatchScheduler(_echo_batches(calls), max_batch_size=2, max_wait_ms=50)
+        scheduler.start()
+        results = await asyncio.gather(*(scheduler.submit(i) for i in range(5)))
+        await scheduler.stop()
+        return results
+
+    assert asyncio.run(run()) == [[0], [1], [2], [3], [4]]
+    assert calls == [2, 2, 1]
+
+
+def test_full_queue_drops_the_oldest_frame():
+    async def run():
+        # Not started: frames stay queued, so the queue fills up
+        scheduler = BatchScheduler(_echo_batches([]), max_queue_size=2)
+        tasks = [asyncio.create_task(scheduler.submit(i)) for i in range(3)]
+        await asyncio.sleep(0)
+        oldest = await tasks[0]
+        dropped = scheduler.dropped_frames
+        await scheduler.stop()
+        return oldest, dropped, [await task for task in tasks[1:]]
+
+    oldest, dropped, rest = asyncio.run(run())
+    assert oldest is None
+    assert dropped == 1
+    assert rest == [None, None]
+
+
+def test_stop_resolves_in_flight_and_queued_frames_to_none():
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking_batch(frames):
+        started.set()
+        release.wait(5)
+        return [[frame] for frame in frames]
+
+    async def run():
+        scheduler = BatchScheduler(blocking_batch, max_batch_size=1, max_wait_ms=0)
+        scheduler.start()
+        tasks = [asyncio.create_task(scheduler.submit(i)) for i in range(2)]
+        await asyncio.to_thread(started.wait, 5)
+        await scheduler.stop()
+        results = await asyncio.wait_for(asyncio.gather(*tasks), 1)
+        release.set()
+        return results
+
+    assert asyncio.run(run()) == [None, None]
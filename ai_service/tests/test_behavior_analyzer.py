@@ -0,0 +1,48 @@
+"""Tests for behavior_analyzer.BehaviorAnalyzer."""
+
+from datetime import datetime, timezone
+
+import behavior_analyzer
+from behavior_analyzer import BehaviorAnalyzer
+
+
+class _FakeCursor(list):
+    """Chainable stand-in for a pymongo cursor over fixed documents."""
+
+    def hint(self, *args):
+        return self
+
+    def sort(self, *args):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    def batch_size(self, *args):
+        return self
+
+
+class _FakeCollection:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def find(self, *args, **kwargs):
+        return _FakeCursor(dict(doc) for doc in self._docs)
+
+
+def test_get_recent_alerts_tolerates_legacy_timestamps(monkeypatch):
+    stamp = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+    docs = [
+        {"event_type": "unknown_person", "timestamp": stamp},
+        {"event_type": "unknown_person", "timestamp": "2023-01-01T00:00:00"},
+        {"event_type": "restricted_zone_entry"},
+    ]
+    monkeypatch.setattr(behavior_analyzer, "events_col", lambda: _FakeCollection(docs))
+
+    alerts = BehaviorAnalyzer().get_recent_alerts()
+
+    assert [alert.get("timestamp") for alert in alerts] == [
+        stamp.isoformat(),
+        "2023-01-01T00:00:00",
+        None,
+    ]
@@ -0,0 +1,48 @@
+"""Tests for geofence_monitor.BoundaryConfig."""
+
+import cv2
+import numpy as np
+
+from geofence_monitor import BoundaryConfig
+
+SQUARE = [(0, 0), (100, 0), (100, 100), (0, 100)]
+
+
+def test_edge_and_vertex_points_are_inside():
+    boundary = BoundaryConfig(camera_id="cam", points=SQUARE)
+    on_boundary = [(0, 0), (100, 50), (50, 100), (100, 100), (0, 50), (50, 0)]
+
+    for point in on_boundary:
+        assert boundary.is_inside(point), point
+    assert boundary.contains_points(np.array(on_boundary)).all()
+
+
+def test_outside_points_are_outside():
+    boundary = BoundaryConfig(camera_id="cam", points=SQUARE)
+    outside = [(101, 50), (50, -1), (-1, -1), (150, 150)]
+
+    for point in outside:
+        assert not boundary.is_inside(point), point
+    assert not boundary.contains_points(np.array(outside)).any()
+
+
+def test_matches_point_polygon_test():
+    points = [(10, 10), (200, 40), (160, 180), (90, 120), (20, 160)]
+    boundary = BoundaryConfig(camera_id="cam", points=points)
+    rng = np.random.default_rng(0)
+    samples = np.vstack([rng.integers(0, 220, size=(2000, 2)), np.array(points)])
+
+    expected = [
+        cv2.pointPolygonTest(boundary._contour, (int(x), int(y)), False) >= 0
+        for x, y in samples
+    ]
+    assert boundary.contains_points(samples).tolist() == expected
+    assert [boundary.is_inside((int(x), int(y))) for x, y in samples] == expected
+
+
+def test_configs_compare_by_points():
+    a = BoundaryConfig(camera_id="cam", points=SQUARE)
+    b = BoundaryConfig(camera_id="cam", points=list(SQUARE))
+
+    assert a == b
+    assert a != BoundaryConfig(camera_id="cam", points=SQUARE[:3])
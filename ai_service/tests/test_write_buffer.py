@@ -0,0 +1,73 @@
+"""Tests for write_buffer.EventWriteBuffer."""
+
+import asyncio
+
+import pytest
+
+import write_buffer
+from write_buffer import EventWriteBuffer
+
+
+class _FakeEvents:
+    """Stands in for the events collection and records insert_many calls."""
+
+    def __init__(self):
+        self.batches = []
+
+    def insert_many(self, docs, ordered=True):
+        self.batches.append((list(docs), ordered))
+
+
+@pytest.fixture
+def events(monkeypatch):
+    fake = _FakeEvents()
+    monkeypatch.setattr(write_buffer, "events_col", lambda: fake)
+    return fake
+
+
+async def _wait_for_batches(events, count, timeout=1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while len(events.batches) < count and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.005)
+
+
+def test_reaching_max_pending_flushes_before_the_interval(events):
+    async def run():
+        # An hour-long interval: only max_pending can trigger this flush
+        buffer = EventWriteBuffer("test", flush_interval_ms=3_600_000, max_pending=3)
+        buffer.start()
+        for i in range(3):
+            buffer.append({"n": i})
+        await _wait_for_batches(events, 1)
+        pending = len(buffer)
+        await buffer.stop()
+        return pending
+
+    assert asyncio.run(run()) == 0
+    assert events.batches == [([{"n": 0}, {"n": 1}, {"n": 2}], False)]
+
+
+def test_elapsed_interval_flushes_a_partial_batch(events):
+    async def run():
+        buffer = EventWriteBuffer("test", flush_interval_ms=20, max_pending=100)
+        buffer.start()
+        buffer.append({"n": 0})
+        await _wait_for_batches(events, 1)
+        flushed = list(events.batches)
+        await buffer.stop()
+        return flushed
+
+    assert asyncio.run(run()) == [([{"n": 0}], False)]
+
+
+def test_stop_drains_the_buffer_with_insert_many(events):
+    async def run():
+        buffer = EventWriteBuffer("test", flush_interval_ms=3_600_000, max_pending=100)
+        buffer.start()
+        buffer.append({"n": 0})
+        buffer.append({"n": 1})
+        await buffer.stop()
+        return len(buffer)
+
+    assert asyncio.run(run()) == 0
+    assert events.batches == [([{"n": 0}, {"n": 1}], False)]
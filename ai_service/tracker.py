@@ -3,6 +3,10 @@ tracker.py - Multi-camera visitor movement tracker.
 
 Records every detection sighting and derives entry/exit events.
 All state lives in MongoDB (events collection) so it survives restarts.
+
+Sightings are written behind through an EventWriteBuffer
+(write_buffer.py), so Mongo sees a few round-trips per second instead of
+one per recognised face.
 """
 
 from __future__ import annotations
@@ -12,6 +16,7 @@ from datetime import datetime, timezone
 from typing import Dict, List, Optional
 
 from db import events_col
+from write_buffer import EventWriteBuffer
 
 logger = logging.getLogger(__name__)
 
@@ -27,8 +32,30 @@ class MultiCameraTracker:
     This class is intentionally thin – it writes events to MongoDB and
     lets callers query back the history they need. The BehaviorAnalyzer
     (behavior_analyzer.py) handles alert logic on top of these events.
+
+    Usage
+    -----
+    tracker = MultiCameraTracker()
+    tracker.start()                 # inside a running event loop
+    tracker.record(...)             # buffered, flushed in the background
+    await tracker.stop()            # flushes whatever is still buffered
     """
 
+    def __init__(self, flush_interval_ms: float = 200.0) -> None:
+        self._writer = EventWriteBuffer("Tracker", flush_interval_ms)
+
+    # ----------------------------------------------------------
+    # Lifecycle
+    # ----------------------------------------------------------
+
+    def start(self) -> None:
+        """Start the background flusher."""
+        self._writer.start()
+
+    async def stop(self) -> None:
+        """Stop the flusher and write out any buffered events."""
+        await self._writer.stop()
+
     # ----------------------------------------------------------
     # Write path
     # ----------------------------------------------------------
@@ -44,9 +71,9 @@ class MultiCameraTracker:
         timestamp: Optional[datetime] = None,
     ) -> Dict:
         """
-        Persist an identity-tracking event.
+        Buffer an identity-tracking event for the next flush.
 
-        Returns the document that was inserted (without _id).
+        Returns a JSON-ready copy of the document that will be inserted.
         """
         ts = timestamp or datetime.now(timezone.utc)
 
@@ -61,14 +88,8 @@ class MultiCameraTracker:
             "timestamp": ts,
         }
 
-        try:
-            events_col().insert_one(doc)
-        except Exception as exc:
-            logger.warning("Tracker insert failed: %s", exc)
-
-        doc.pop("_id", None)
-        doc["timestamp"] = ts.isoformat()
-        return doc
+        self._writer.append(doc)
+        return {**doc, "timestamp": ts.isoformat()}
 
     # ----------------------------------------------------------
     # Read path
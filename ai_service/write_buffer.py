@@ -0,0 +1,119 @@
+"""
+write_buffer.py - Write-behind buffer for the events collection.
+
+The tracker, behavior analyzer and geofence monitor append their event
+documents here instead of inserting them one by one. A background task
+writes the buffer with one unordered `insert_many` every
+`flush_interval_ms`, or as soon as `max_pending` documents are waiting,
+and `stop()` writes out whatever is left.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from db import events_col
+
+logger = logging.getLogger(__name__)
+
+# ──────────────────────────────────────────────────────────
+# Defaults (overridable via constructor)
+# ──────────────────────────────────────────────────────────
+
+DEFAULT_FLUSH_INTERVAL_MS = 200.0
+DEFAULT_MAX_PENDING = 64
+
+
+# ──────────────────────────────────────────────────────────
+# Buffer
+# ──────────────────────────────────────────────────────────
+
+class EventWriteBuffer:
+    """
+    Buffers event documents and inserts them into MongoDB in batches.
+
+    Usage
+    -----
+    buffer = EventWriteBuffer("tracker")
+    buffer.start()                  # inside a running event loop
+    buffer.append(doc)              # never blocks on MongoDB
+    await buffer.stop()             # flushes whatever is still buffered
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush_interval_ms: float = DEFAULT_FLUSH_INTERVAL_MS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ) -> None:
+        self.name = name
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_pending = max(1, max_pending)
+        # deque.append/popleft are atomic, so append() needs no lock
+        self._docs: Deque[Dict] = deque()
+        self._flush_now: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    # ----------------------------------------------------------
+    # Lifecycle
+    # ----------------------------------------------------------
+
+    def start(self) -> None:
+        """Start the background flusher."""
+        if self._task is not None and not self._task.done():
+            return
+        self._flush_now = asyncio.Event()
+        self._task = asyncio.create_task(self._flush_loop(), name=f"{self.name}-flush")
+
+    async def stop(self) -> None:
+        """Stop the flusher and write out any buffered documents."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    # ----------------------------------------------------------
+    # Public API
+    # ----------------------------------------------------------
+
+    def append(self, doc: Dict) -> None:
+        """Buffer a document; wakes the flusher early once `max_pending` wait."""
+        self._docs.append(doc)
+        if len(self._docs) >= self.max_pending and self._flush_now is not None:
+            self._flush_now.set()
+
+    async def flush(self) -> None:
+        """Write all buffered documents in a single unordered insert_many."""
+        batch: List[Dict] = []
+        while self._docs:
+            batch.append(self._docs.popleft())
+        if not batch:
+            return
+
+        try:
+            await asyncio.to_thread(events_col().insert_many, batch, ordered=False)
+        except Exception as exc:
+            logger.warning("%s flush failed (%d documents): %s", self.name, len(batch), exc)
+
+    # ----------------------------------------------------------
+    # Internal helpers
+    # ----------------------------------------------------------
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()